@@ -0,0 +1,193 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULT_DIR = os.path.join(os.path.dirname(CODE_DIR), '结果图表')
+MANIFEST_FILE = os.path.join(RESULT_DIR, '.build_manifest.json')
+
+# 结果图表中的产物：由哪个脚本生成、脚本写出的文件名与结果图表中的文件名、需要的输入文件与额外依赖的源码
+ARTIFACTS = [
+    {'script': 'problem_2_exhaustive_process_decision_analysis.py',
+     'outputs': {'decision_results.xlsx': '问题二决策结果.xlsx'},
+     'inputs': [], 'deps': []},
+    {'script': 'problem_3_semi_finished_goods_analysis.py.py',
+     'outputs': {'multi_stage_production_results.xlsx': '问题三决策结果.xlsx'},
+     'inputs': [], 'deps': ['production_kernels.py']},
+    {'script': 'problem_4_defective_rate_change_with_problem_3_execution.py.py',
+     'outputs': {'optimal_strategies_distribution.xlsx': '问题四次品率改变后问题三决策方案最优排名统计.xlsx',
+                 'strategy_profit_summary.xlsx': '问题四次品率改变后问题三决策方案利润分布汇总.xlsx'},
+     'inputs': ['decision_combinations.txt'], 'deps': ['production_kernels.py', 'strategy_profit_summary.py']},
+    {'script': 'problem_4_sampling_simulation_and_plot.py.py',
+     'outputs': {'defect_rate_distribution.png': '问题四：次品率估计分布.png'},
+     'inputs': [], 'deps': []},
+]
+
+# 在子进程中固定随机种子后以 __main__ 方式执行脚本
+RUNNER = '''
+import random, runpy, sys
+script, seed = sys.argv[1], int(sys.argv[2])
+sys.path.insert(0, sys.argv[3])
+random.seed(seed)
+try:
+    import numpy
+    numpy.random.seed(seed % 2**32)
+except ImportError:
+    pass
+runpy.run_path(script, run_name='__main__')
+'''
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=CODE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def artifact_record(artifact, seed):
+    """
+    记录产物的来源：脚本与依赖源码的哈希、输入文件哈希和随机种子。
+    指纹只由这些内容决定，与提交号无关，因此无关文件的改动不会使产物过期。
+    """
+    sources = {name: file_digest(os.path.join(CODE_DIR, name)) for name in [artifact['script']] + artifact['deps']}
+    inputs = {}
+    for name in artifact['inputs']:
+        path = os.path.join(CODE_DIR, name)
+        inputs[name] = file_digest(path) if os.path.exists(path) else None
+    payload = json.dumps({'sources': sources, 'inputs': inputs, 'seed': seed}, sort_keys=True)
+    return {
+        'fingerprint': hashlib.sha256(payload.encode()).hexdigest(),
+        'sources': sources,
+        'inputs': inputs,
+        'seed': seed,
+    }
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    tmp_file = MANIFEST_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_file, MANIFEST_FILE)
+
+
+def is_stale(artifact, record, manifest):
+    # 清单按结果图表中的文件名记录，脚本的任一产物缺失或过期都需要重新运行
+    for name in artifact['outputs'].values():
+        if not os.path.exists(os.path.join(RESULT_DIR, name)):
+            return True
+        previous = manifest.get(name)
+        if previous is None or previous['fingerprint'] != record['fingerprint']:
+            return True
+    return False
+
+
+def build_artifact(artifact, seed):
+    # 每个脚本在独立的临时目录中运行，避免并行时输出文件互相覆盖
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in artifact['inputs']:
+            path = os.path.join(CODE_DIR, name)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"缺少输入文件: {path}")
+            shutil.copy(path, work_dir)
+
+        start = time.time()
+        result = subprocess.run(
+            [sys.executable, '-c', RUNNER, os.path.join(CODE_DIR, artifact['script']), str(seed), CODE_DIR],
+            cwd=work_dir, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"{artifact['script']} 运行失败:\n{result.stderr}")
+
+        # 全部产物都生成后再移入结果图表，避免只更新其中一部分
+        for output in artifact['outputs']:
+            if not os.path.exists(os.path.join(work_dir, output)):
+                raise FileNotFoundError(f"{artifact['script']} 未生成 {output}")
+        for output, name in artifact['outputs'].items():
+            shutil.move(os.path.join(work_dir, output), os.path.join(RESULT_DIR, name))
+        return time.time() - start
+
+
+def build(names=None, seed=2024, jobs=None, force=False, dry_run=False):
+    manifest = load_manifest()
+    selected = [a for a in ARTIFACTS
+                if not names or a['script'] in names or any(name in names for name in a['outputs'].values())]
+
+    pending = []
+    for artifact in selected:
+        record = artifact_record(artifact, seed)
+        if force or is_stale(artifact, record, manifest):
+            pending.append((artifact, record))
+        else:
+            print(f"最新，跳过: {', '.join(artifact['outputs'].values())}")
+
+    if dry_run:
+        for artifact, _ in pending:
+            print(f"需要重新生成: {', '.join(artifact['outputs'].values())}")
+        return True
+
+    revision = git_revision()
+    failed = False
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        futures = [(artifact, record, executor.submit(build_artifact, artifact, seed)) for artifact, record in pending]
+        for artifact, record, future in futures:
+            try:
+                duration = future.result()
+            except (OSError, RuntimeError) as e:
+                print(f"生成失败: {artifact['script']}\n{e}")
+                failed = True
+                continue
+            record.update({
+                'script': artifact['script'],
+                'git_revision': revision,
+                'python': platform.python_version(),
+                'built_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'duration_seconds': round(duration, 2),
+            })
+            for name in artifact['outputs'].values():
+                manifest[name] = record
+            save_manifest(manifest)
+            print(f"已生成: {', '.join(artifact['outputs'].values())} ({duration:.1f} 秒)")
+
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量生成结果图表：只重新运行输入、代码或种子发生变化的产物")
+    parser.add_argument('artifacts', nargs='*', help="只生成指定的产物（产物名或脚本名），默认全部")
+    parser.add_argument('--seed', type=int, default=2024, help="随机种子")
+    parser.add_argument('--jobs', type=int, default=None, help="并行运行的脚本数，默认为 CPU 核数")
+    parser.add_argument('--force', action='store_true', help="忽略清单，全部重新生成")
+    parser.add_argument('--dry-run', action='store_true', help="只列出需要重新生成的产物")
+    args = parser.parse_args()
+
+    ok = build(args.artifacts, seed=args.seed, jobs=args.jobs, force=args.force, dry_run=args.dry_run)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
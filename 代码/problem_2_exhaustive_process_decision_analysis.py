@@ -12,75 +12,127 @@ def improved_production_decision_process(
         inspect_component_1=True, inspect_component_2=True, inspect_product=True,
         disassemble_defective=True, max_cycles=2
 ):
-    total_revenue = 0
-    total_cost = 0
-
-    # 初始购买成本
-    total_cost += initial_quantity * (purchase_cost_1 + purchase_cost_2)
-
-    # 初始零件检测 - 只在开始时进行一次
-    if inspect_component_1:
-        inventory_1 = int(initial_quantity * (1 - defect_rate_1))  # 检测零件1，使用合格品
-        total_cost += initial_quantity * inspection_cost_1
-    else:
-        inventory_1 = initial_quantity  # 不检测，使用全部零件1，包括不合格品
-
-    if inspect_component_2:
-        inventory_2 = int(initial_quantity * (1 - defect_rate_2))  # 检测零件2，使用合格品
-        total_cost += initial_quantity * inspection_cost_2
-    else:
-        inventory_2 = initial_quantity  # 不检测，使用全部零件2，包括不合格品
-
-    for cycle in range(max_cycles):
-        # 计算当前批次的零件合格率
-        part1_quality = 1 - defect_rate_1 if not inspect_component_1 else 1.0
-        part2_quality = 1 - defect_rate_2 if not inspect_component_2 else 1.0
-
-        # 检查库存是否足够装配
-        if inventory_1 == 0 or inventory_2 == 0:
-            break  # 退出循环
-
-        # 组装过程，成品合格率 = 零件1合格率 * 零件2合格率 * (1 - 成品次品率)
-        assembled_products = min(inventory_1, inventory_2)
-
-        # 装配成品
-        inventory_1 -= assembled_products
-        inventory_2 -= assembled_products
-        total_cost += assembled_products * assembly_cost
-
-        # 成品合格率的计算
-        product_quality = part1_quality * part2_quality * (1 - defect_rate_product)
-
-        # 成品检测
-        if inspect_product:
-            qualified_products = int(assembled_products * product_quality)
-            defective_products = assembled_products - qualified_products
-            total_cost += assembled_products * inspection_cost_product
-            returned_products = 0  # 无退换
+    # 单批次即只有一个周期、没有期初库存的多周期过程
+    lot = {'quantity': initial_quantity, 'defect_rate_1': defect_rate_1,
+           'defect_rate_2': defect_rate_2, 'defect_rate_product': defect_rate_product}
+    period = next(multi_period_production_process(
+        [lot], purchase_cost_1, inspection_cost_1, purchase_cost_2, inspection_cost_2,
+        assembly_cost, inspection_cost_product, market_price, return_loss, disassembly_cost,
+        inspect_component_1, inspect_component_2, inspect_product, disassemble_defective, max_cycles
+    ))
+    return period['profit'], period['revenue'], period['cost']
+
+
+# 多周期生产过程：逐期读入来料批次，零件库存跨期结转
+def multi_period_production_process(
+        lots,
+        purchase_cost_1, inspection_cost_1,
+        purchase_cost_2, inspection_cost_2,
+        assembly_cost, inspection_cost_product,
+        market_price, return_loss, disassembly_cost,
+        inspect_component_1=True, inspect_component_2=True, inspect_product=True,
+        disassemble_defective=True, max_cycles=2
+):
+    """
+    lots 为来料批次的可迭代对象（可以是生成器），每批为
+    {'quantity': 数量, 'defect_rate_1': ..., 'defect_rate_2': ..., 'defect_rate_product': ...}。
+    未装配的零件（min 之后剩余的、拆解回收的）结转到下一期，库存次品率按数量加权混合。
+    逐期产出 {'period', 'profit', 'revenue', 'cost', 'inventory_1', 'inventory_2'}，内存占用与周期数无关。
+    """
+    inventory_1 = inventory_2 = 0
+    stock_rate_1 = stock_rate_2 = 0.0  # 结转库存的次品率
+
+    for period, lot in enumerate(lots, 1):
+        quantity = lot['quantity']
+        defect_rate_product = lot['defect_rate_product']
+        total_revenue = 0
+        total_cost = 0
+
+        # 初始购买成本
+        total_cost += quantity * (purchase_cost_1 + purchase_cost_2)
+
+        # 来料检测 - 每批到货时进行一次
+        if inspect_component_1:
+            received_1 = int(quantity * (1 - lot['defect_rate_1']))  # 检测零件1，使用合格品
+            total_cost += quantity * inspection_cost_1
         else:
-            qualified_products = int(assembled_products * product_quality)
-            defective_products = assembled_products - qualified_products
-            returned_products = defective_products
-            # 销售的次品导致退货.
-            total_cost += returned_products * return_loss  # 调换损失
-
-        # 销售收入
-        total_revenue += qualified_products * market_price
-
-        # 处理不合格品
-        total_defective = defective_products
-        if total_defective > 0:
-            if disassemble_defective:
-                total_cost += total_defective * disassembly_cost
-                inventory_1 += total_defective  # 拆解后的次品重新进入生产流程
-                inventory_2 += total_defective
-            else:
-                # 如果不拆解，次品直接丢弃
-                total_defective = 0
+            received_1 = quantity  # 不检测，使用全部零件1，包括不合格品
+        stock_rate_1 = _mix_defect_rate(inventory_1, stock_rate_1, received_1, lot['defect_rate_1'])
+        inventory_1 += received_1
 
-    # 返回总利润
-    profit = total_revenue - total_cost
-    return profit, total_revenue, total_cost
+        if inspect_component_2:
+            received_2 = int(quantity * (1 - lot['defect_rate_2']))  # 检测零件2，使用合格品
+            total_cost += quantity * inspection_cost_2
+        else:
+            received_2 = quantity  # 不检测，使用全部零件2，包括不合格品
+        stock_rate_2 = _mix_defect_rate(inventory_2, stock_rate_2, received_2, lot['defect_rate_2'])
+        inventory_2 += received_2
+
+        for cycle in range(max_cycles):
+            # 计算当前批次的零件合格率
+            part1_quality = 1 - stock_rate_1 if not inspect_component_1 else 1.0
+            part2_quality = 1 - stock_rate_2 if not inspect_component_2 else 1.0
+
+            # 检查库存是否足够装配
+            if inventory_1 == 0 or inventory_2 == 0:
+                break  # 退出循环
+
+            # 组装过程，成品合格率 = 零件1合格率 * 零件2合格率 * (1 - 成品次品率)
+            assembled_products = min(inventory_1, inventory_2)
+
+            # 装配成品
+            inventory_1 -= assembled_products
+            inventory_2 -= assembled_products
+            total_cost += assembled_products * assembly_cost
+
+            # 成品合格率的计算
+            product_quality = part1_quality * part2_quality * (1 - defect_rate_product)
+
+            # 成品检测
+            if inspect_product:
+                qualified_products = int(assembled_products * product_quality)
+                defective_products = assembled_products - qualified_products
+                total_cost += assembled_products * inspection_cost_product
+                returned_products = 0  # 无退换
+            else:
+                qualified_products = int(assembled_products * product_quality)
+                defective_products = assembled_products - qualified_products
+                returned_products = defective_products
+                # 销售的次品导致退货.
+                total_cost += returned_products * return_loss  # 调换损失
+
+            # 销售收入
+            total_revenue += qualified_products * market_price
+
+            # 处理不合格品
+            total_defective = defective_products
+            if total_defective > 0:
+                if disassemble_defective:
+                    total_cost += total_defective * disassembly_cost
+                    inventory_1 += total_defective  # 拆解后的次品重新进入生产流程
+                    inventory_2 += total_defective
+                else:
+                    # 如果不拆解，次品直接丢弃
+                    total_defective = 0
+
+        # 返回本期利润，剩余库存留到下一期
+        yield {
+            'period': period,
+            'profit': total_revenue - total_cost,
+            'revenue': total_revenue,
+            'cost': total_cost,
+            'inventory_1': inventory_1,
+            'inventory_2': inventory_2,
+        }
+
+
+def _mix_defect_rate(stock, stock_rate, received, received_rate):
+    # 结转库存与新到货按数量加权；没有结转库存时直接使用新批次的次品率
+    if stock == 0:
+        return received_rate
+    if received == 0:
+        return stock_rate
+    return (stock * stock_rate + received * received_rate) / (stock + received)
 
 
 # 优化决策函数，并将结果保存为DataFrame
@@ -1,125 +1,185 @@
 import itertools
 import pandas as pd
+import production_kernels
+from production_kernels import build_production_config, split_decisions
 
 
 def multi_stage_production_decision_process(
-    initial_quantity,
-    component_params,
-    semi_product_params,
-    final_product_params,
+    config,
+    decisions,
     max_cycles=3
     ):
-    total_revenue = 0
-    total_cost = 0
-    
-    # 零件初始购买成本
-    for comp in component_params:
-        total_cost += initial_quantity * comp['purchase_cost']
-
-    # 零件检测和初始库存计算
-    inventories = []
-    for comp in component_params:
-        if comp['inspect']:
-            inventory = int(initial_quantity * (1 - comp['defect_rate']))
-            total_cost += initial_quantity * comp['inspection_cost']
-        else:
-            inventory = initial_quantity
-        inventories.append(inventory)
-
+    # 单批次即只有一个周期、没有期初库存的多周期过程
+    lot = {'quantity': config.initial_quantity}
+    period = next(multi_period_production_process(config, decisions, [lot], max_cycles))
+    return period['profit'], period['revenue'], period['cost']
+
+
+def multi_period_production_process(config, decisions, lots, max_cycles=3):
+    """
+    逐期读入来料批次的多周期生产过程。lots 为可迭代对象（可以是生成器），每批为
+    {'quantity': 数量, 'component_defect_rates': [...], 'semi_defect_rates': [...], 'final_defect_rate': ...}，
+    次品率缺省时使用 config 中的值。
+    零件库存（min 之后未装配的、拆解回收的）和拆解成品得到的半成品库存结转到下一期，
+    零件库存的次品率按数量加权混合。各周期装配成品时 min 之后剩余的合格半成品单独计入合格半成品库存，
+    下一期起直接参与成品装配，不再重复装配、检测，也不再叠加次品率；库存中实际合格的比例按数量加权混合。
+    逐期产出本期的利润、收入、成本和期末库存，内存占用与周期数无关。
+    """
+    component_params = config.component_params
+    semi_product_params = config.semi_product_params
+    final_product_params = config.final_product_params
+    (inspect_components, inspect_semi_products, disassemble_semi_products,
+     inspect_final, disassemble_final) = split_decisions(decisions, len(component_params), len(semi_product_params))
+
+    inventories = [0] * len(component_params)
+    stock_rates = [0.0] * len(component_params)  # 结转零件库存的次品率
     # 半成品库存
     semi_product_inventories = [0] * len(semi_product_params)
-
-    for cycle in range(max_cycles):
-        # 半成品的装配与检测
-        semi_products = []
-        for idx, semi_prod in enumerate(semi_product_params):
-            assembled = min([inventories[i-1] for i in semi_prod['components']])
-            assembled += semi_product_inventories[idx]  # 加上之前的半成品库存
-            semi_product_inventories[idx] = 0  # 清空半成品库存
-            
-            for i in semi_prod['components']:
-                inventories[i-1] -= min(assembled, inventories[i-1])
-            total_cost += assembled * semi_prod['assembly_cost']
-
-            # 计算半成品的实际合格率
-            semi_product_quality = 1.0
-            for i in semi_prod['components']:
-                if not component_params[i-1]['inspect']:
-                    semi_product_quality *= (1 - component_params[i-1]['defect_rate'])
-            semi_product_quality *= (1 - semi_prod['defect_rate'])  # 考虑装配过程的次品率
-
-            actual_qualified = int(assembled * semi_product_quality)
-            if semi_prod['inspect']:
-                qualified = actual_qualified
-                defective = assembled - qualified
-                total_cost += assembled * semi_prod['inspection_cost']
-                if semi_prod['disassemble']:
-                    total_cost += defective * semi_prod['disassembly_cost']
-                    for i in semi_prod['components']:
-                        inventories[i-1] += defective
+    # 往期结转的合格半成品库存及其中实际合格的比例
+    qualified_semi_inventories = [0] * len(semi_product_params)
+    qualified_semi_qualities = [0.0] * len(semi_product_params)
+
+    for period, lot in enumerate(lots, 1):
+        quantity = lot['quantity']
+        component_defect_rates = lot.get('component_defect_rates', [comp.defect_rate for comp in component_params])
+        semi_defect_rates = lot.get('semi_defect_rates', [semi.defect_rate for semi in semi_product_params])
+        final_defect_rate = lot.get('final_defect_rate', final_product_params.defect_rate)
+        total_revenue = 0
+        total_cost = 0
+
+        # 零件购买成本
+        for comp in component_params:
+            total_cost += quantity * comp.purchase_cost
+
+        # 零件检测，新到零件并入库存
+        for c, (comp, inspect) in enumerate(zip(component_params, inspect_components)):
+            if inspect:
+                received = int(quantity * (1 - component_defect_rates[c]))
+                total_cost += quantity * comp.inspection_cost
             else:
-                qualified = assembled  # 不检验时，所有产品都进入下一阶段，包括不合格品
-
-            semi_products.append((qualified, actual_qualified))
-
-        # 成品的装配与检测
-        final_assembled = min([sp[0] for sp in semi_products])
-        total_cost += final_assembled * final_product_params['assembly_cost']
-        
-        # 计算成品的实际合格率
-        final_quality = 1.0
-
-        # 考虑每个半成品的实际合格率，而不是仅考虑是否检测
-        for idx, sp in enumerate(semi_products):
-            qualified, actual_qualified = sp
-            semi_product_quality = actual_qualified / qualified if qualified > 0 else 0
-            final_quality *= semi_product_quality
-
-        # 再考虑成品装配过程的次品率
-        final_quality *= (1 - final_product_params['defect_rate'])  
-
-        actual_qualified_products = int(final_assembled * final_quality)
+                received = quantity
+            if inventories[c] == 0:
+                stock_rates[c] = component_defect_rates[c]
+            elif received > 0:
+                stock_rates[c] = ((inventories[c] * stock_rates[c] + received * component_defect_rates[c])
+                                  / (inventories[c] + received))
+            inventories[c] += received
+
+        # 本期各周期剩余的合格半成品数量及其中实际合格的数量，期末才并入库存
+        unused_semi_products = [0] * len(semi_product_params)
+        unused_actual_qualified = [0.0] * len(semi_product_params)
+        for cycle in range(max_cycles):
+            # 半成品的装配与检测
+            semi_products = []
+            for idx, semi_prod in enumerate(semi_product_params):
+                assembled = min([inventories[i-1] for i in semi_prod.components])
+                assembled += semi_product_inventories[idx]  # 加上之前的半成品库存
+                semi_product_inventories[idx] = 0  # 清空半成品库存
+
+                for i in semi_prod.components:
+                    inventories[i-1] -= min(assembled, inventories[i-1])
+                total_cost += assembled * semi_prod.assembly_cost
+
+                # 计算半成品的实际合格率
+                semi_product_quality = 1.0
+                for i in semi_prod.components:
+                    if not inspect_components[i-1]:
+                        semi_product_quality *= (1 - stock_rates[i-1])
+                semi_product_quality *= (1 - semi_defect_rates[idx])  # 考虑装配过程的次品率
+
+                actual_qualified = int(assembled * semi_product_quality)
+                if inspect_semi_products[idx]:
+                    qualified = actual_qualified
+                    defective = assembled - qualified
+                    total_cost += assembled * semi_prod.inspection_cost
+                    if disassemble_semi_products[idx]:
+                        total_cost += defective * semi_prod.disassembly_cost
+                        for i in semi_prod.components:
+                            inventories[i-1] += defective
+                else:
+                    qualified = assembled  # 不检验时，所有产品都进入下一阶段，包括不合格品
+
+                semi_products.append((qualified, actual_qualified))
+
+            # 成品的装配与检测，往期结转的合格半成品直接参与装配
+            final_assembled = min([sp[0] + qualified_semi_inventories[idx] for idx, sp in enumerate(semi_products)])
+            total_cost += final_assembled * final_product_params.assembly_cost
+
+            # 计算成品的实际合格率
+            final_quality = 1.0
+
+            # 考虑每个半成品的实际合格率，而不是仅考虑是否检测
+            for idx, sp in enumerate(semi_products):
+                qualified, actual_qualified = sp
+                semi_product_quality = actual_qualified / qualified if qualified > 0 else 0
+                # 先使用本周期装配的半成品，不足的部分取自结转库存
+                from_stock = max(final_assembled - qualified, 0)
+                unused = qualified - (final_assembled - from_stock)
+                unused_semi_products[idx] += unused
+                unused_actual_qualified[idx] += unused * semi_product_quality
+                if from_stock > 0:
+                    semi_product_quality = ((final_assembled - from_stock) * semi_product_quality
+                                            + from_stock * qualified_semi_qualities[idx]) / final_assembled
+                    qualified_semi_inventories[idx] -= from_stock
+                final_quality *= semi_product_quality
+
+            # 再考虑成品装配过程的次品率
+            final_quality *= (1 - final_defect_rate)
+
+            actual_qualified_products = int(final_assembled * final_quality)
+
+            if inspect_final:
+                qualified_products = actual_qualified_products
+                defective_products = final_assembled - qualified_products
+                total_cost += final_assembled * final_product_params.inspection_cost
+                returned_products = 0
+            else:
+                qualified_products = actual_qualified_products
+                defective_products = final_assembled - qualified_products
+                returned_products = defective_products# 实际不合格品最终会被退回
+                total_cost += returned_products * final_product_params.return_loss
+
+            # 销售收入
+            total_revenue += qualified_products * final_product_params.market_price
+
+            # 处理不合格品
+            total_defective = defective_products
+            if total_defective > 0 and disassemble_final:
+                total_cost += total_defective * final_product_params.disassembly_cost
+                # 将拆解的成品均匀分配到各个半成品库存中
+                for i in range(len(semi_product_params)):
+                    semi_product_inventories[i] += total_defective // len(semi_product_params)
+
+        # 本期剩余的合格半成品并入结转库存，留到下一期
+        for idx in range(len(semi_product_params)):
+            stock = qualified_semi_inventories[idx] + unused_semi_products[idx]
+            if stock > 0:
+                qualified_semi_qualities[idx] = ((qualified_semi_inventories[idx] * qualified_semi_qualities[idx]
+                                                  + unused_actual_qualified[idx]) / stock)
+            qualified_semi_inventories[idx] = stock
+
+        # 返回本期利润，剩余库存留到下一期
+        yield {
+            'period': period,
+            'profit': total_revenue - total_cost,
+            'revenue': total_revenue,
+            'cost': total_cost,
+            'inventories': list(inventories),
+            'semi_product_inventories': list(semi_product_inventories),
+            'qualified_semi_inventories': list(qualified_semi_inventories),
+        }
 
-        if final_product_params['inspect']:
-            qualified_products = actual_qualified_products
-            defective_products = final_assembled - qualified_products
-            total_cost += final_assembled * final_product_params['inspection_cost']
-            returned_products = 0
-        else:
-            qualified_products = actual_qualified_products
-            defective_products = final_assembled - qualified_products
-            returned_products = defective_products# 实际不合格品最终会被退回
-            total_cost += returned_products * final_product_params['return_loss']
-        
-        # 销售收入
-        total_revenue += qualified_products * final_product_params['market_price']
-        
-        # 处理不合格品
-        total_defective = defective_products
-        if total_defective > 0 and final_product_params['disassemble']:
-            total_cost += total_defective * final_product_params['disassembly_cost']
-            # 将拆解的成品均匀分配到各个半成品库存中
-            for i in range(len(semi_product_params)):
-                semi_product_inventories[i] += total_defective // len(semi_product_params)
-
-    # 返回总利润
-    profit = total_revenue - total_cost
-    return profit, total_revenue, total_cost
-
-def optimize_multi_stage_decisions(params):
+def optimize_multi_stage_decisions(config, backend=None):
+    # backend 为 None 时使用上面的实现，'numba' 或 'python' 时使用 production_kernels 中的内核，
+    # 'auto' 在安装了 Numba 时使用编译内核，否则使用上面的实现
+    backend = production_kernels.resolve_backend(backend)
     decision_data = []
 
     for decisions in itertools.product([True, False], repeat=16):  # 8个零件 + 3个半成品检测 + 3个半成品拆解 + 1个成品检测 + 1个拆解决策
-        for i, decision in enumerate(decisions[:8]):
-            params['component_params'][i]['inspect'] = decision
-        for i, decision in enumerate(decisions[8:11]):
-            params['semi_product_params'][i]['inspect'] = decision
-        for i, decision in enumerate(decisions[11:14]):
-            params['semi_product_params'][i]['disassemble'] = decision
-        params['final_product_params']['inspect'] = decisions[14]
-        params['final_product_params']['disassemble'] = decisions[15]
-        
-        profit, revenue, cost = multi_stage_production_decision_process(**params)
+        if backend is None:
+            profit, revenue, cost = multi_stage_production_decision_process(config, decisions)
+        else:
+            profit, revenue, cost = production_kernels.evaluate(config, decisions, max_cycles=3, backend=backend)
         
         # 保存决策与结果
         decision_data.append({
@@ -142,27 +202,28 @@ def main():
     params = {
         'initial_quantity': 1000,
         'component_params': [
-            {'defect_rate': 0.10, 'purchase_cost': 2, 'inspection_cost': 1, 'inspect': False},
-            {'defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1, 'inspect': False},
-            {'defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2, 'inspect': False},
-            {'defect_rate': 0.10, 'purchase_cost': 2, 'inspection_cost': 1, 'inspect': False},
-            {'defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1, 'inspect': False},
-            {'defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2, 'inspect': False},
-            {'defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1, 'inspect': False},
-            {'defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2, 'inspect': False}
+            {'defect_rate': 0.10, 'purchase_cost': 2, 'inspection_cost': 1},
+            {'defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1},
+            {'defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2},
+            {'defect_rate': 0.10, 'purchase_cost': 2, 'inspection_cost': 1},
+            {'defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1},
+            {'defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2},
+            {'defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1},
+            {'defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2}
         ],
         'semi_product_params': [
-            {'defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [1, 2, 3], 'inspect': False, 'disassemble': False},
-            {'defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [4, 5, 6], 'inspect': False, 'disassemble': False},
-            {'defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [7, 8], 'inspect': False, 'disassemble': False}
+            {'defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [1, 2, 3]},
+            {'defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [4, 5, 6]},
+            {'defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [7, 8]}
         ],
         'final_product_params': {
             'defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 6, 'market_price': 200,
-            'disassembly_cost': 10, 'return_loss': 40, 'inspect': False, 'disassemble': False
+            'disassembly_cost': 10, 'return_loss': 40
         }
     }
 
-    decision_data = optimize_multi_stage_decisions(params)
+    config = build_production_config(params)
+    decision_data = optimize_multi_stage_decisions(config, backend='auto')
     
     # 保存到Excel文件
     save_decision_data_to_excel(decision_data, 'multi_stage_production_results.xlsx')
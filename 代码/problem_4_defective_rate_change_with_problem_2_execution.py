@@ -1,6 +1,11 @@
 import random
 import itertools
+import numpy as np
+import pandas as pd
 from scipy import stats
+from strategy_profit_summary import StrategyProfitSummary
+
+DECISIONS = list(itertools.product([True, False], repeat=4))
 
 
 def sample_inspection(population_size, sample_size, true_defect_rate):
@@ -28,8 +33,18 @@ def improved_production_decision_process(
     market_price, return_loss, disassembly_cost,
     inspect_component_1=True, inspect_component_2=True, inspect_product=True, 
     disassemble_defective=True, max_cycles=2,
-    sample_size_1=100, sample_size_2=100, sample_size_product=100
+    sample_size_1=100, sample_size_2=100, sample_size_product=100,
+    defect_rates=None, sample_counts=None
 ):
+    """
+    defect_rates, when given as (component 1, component 2, product), replaces the
+    sampled estimates so the process becomes deterministic.
+    sample_counts, when given as a dict, counts the sampling events per stage
+    (keys as in SAMPLED_STAGES): once per component, once per executed cycle for the product.
+    """
+    if sample_counts is not None:
+        sample_counts['component_1'] = sample_counts.get('component_1', 0) + 1
+        sample_counts['component_2'] = sample_counts.get('component_2', 0) + 1
     total_revenue = 0
     total_cost = 0
     
@@ -37,8 +52,11 @@ def improved_production_decision_process(
     total_cost += initial_quantity * (purchase_cost_1 + purchase_cost_2)
     
     # Sample inspection of components
-    defect_rate_1, _ = sample_inspection(initial_quantity, sample_size_1, true_defect_rate_1)
-    defect_rate_2, _ = sample_inspection(initial_quantity, sample_size_2, true_defect_rate_2)
+    if defect_rates is None:
+        defect_rate_1, _ = sample_inspection(initial_quantity, sample_size_1, true_defect_rate_1)
+        defect_rate_2, _ = sample_inspection(initial_quantity, sample_size_2, true_defect_rate_2)
+    else:
+        defect_rate_1, defect_rate_2, defect_rate_product = defect_rates
     
     if inspect_component_1:
         inventory_1 = int(initial_quantity * (1 - defect_rate_1))
@@ -67,7 +85,10 @@ def improved_production_decision_process(
         total_cost += assembled_products * assembly_cost
         
         # Sample inspection of products
-        defect_rate_product, _ = sample_inspection(assembled_products, sample_size_product, true_defect_rate_product)
+        if sample_counts is not None:
+            sample_counts['product'] = sample_counts.get('product', 0) + 1
+        if defect_rates is None:
+            defect_rate_product, _ = sample_inspection(assembled_products, sample_size_product, true_defect_rate_product)
         product_quality = part1_quality * part2_quality * (1 - defect_rate_product)
         
         if inspect_product:
@@ -97,11 +118,12 @@ def improved_production_decision_process(
     return profit, total_revenue, total_cost
 
 
-def optimize_decisions(params):
-    best_profit = float('-inf')
-    best_decisions = None
-    
-    for decisions in itertools.product([True, False], repeat=4):
+def evaluate_decisions(params):
+    """
+    Run one simulation of every decision and return the profits in DECISIONS order.
+    """
+    profits = []
+    for decisions in DECISIONS:
         inspect_1, inspect_2, inspect_prod, disassemble = decisions
         profit, revenue, cost = improved_production_decision_process(
             inspect_component_1=inspect_1,
@@ -110,11 +132,92 @@ def optimize_decisions(params):
             disassemble_defective=disassemble,
             **params
         )
-        if profit > best_profit:
-            best_profit = profit
-            best_decisions = decisions
-    
-    return best_profit, best_decisions
+        profits.append(profit)
+    return profits
+
+
+def optimize_decisions(params):
+    profits = evaluate_decisions(params)
+    best_index = max(range(len(profits)), key=profits.__getitem__)
+    return profits[best_index], DECISIONS[best_index]
+
+
+SAMPLED_STAGES = {
+    # stage: (true defect rate key, per-unit sampling cost key, index in defect_rates)
+    'component_1': ('true_defect_rate_1', 'inspection_cost_1', 0),
+    'component_2': ('true_defect_rate_2', 'inspection_cost_2', 1),
+    'product': ('true_defect_rate_product', 'inspection_cost_product', 2),
+}
+
+
+def sample_size_value_curve(params, stage, sample_sizes):
+    """
+    Value of information of the sample size used to estimate one stage's defect rate.
+
+    The decision is chosen by plugging the estimate k/n into the deterministic model
+    and then paid for at the true rates. The binomial distribution of k is enumerated
+    exactly (the tail below 1e-12 is dropped and the rest renormalised), and decisions
+    are cached per estimate, so the whole curve costs one pass. Sampling costs the stage's
+    inspection cost per sampled unit for every sampling event of the chosen decision: the
+    components are sampled once, the product once per executed cycle. The other stages are
+    taken at their true rates.
+    """
+    rate_key, cost_key, position = SAMPLED_STAGES[stage]
+    true_rates = (params['true_defect_rate_1'], params['true_defect_rate_2'], params['true_defect_rate_product'])
+
+    def profits_at(rates, counts=None):
+        return [
+            improved_production_decision_process(
+                inspect_component_1=d[0], inspect_component_2=d[1], inspect_product=d[2],
+                disassemble_defective=d[3], defect_rates=rates,
+                sample_counts=None if counts is None else counts[i], **params
+            )[0]
+            for i, d in enumerate(DECISIONS)
+        ]
+
+    true_counts = [{} for _ in DECISIONS]
+    true_profits = profits_at(true_rates, true_counts)
+    events = [counts.get(stage, 0) for counts in true_counts]
+    best_true_profit = max(true_profits)
+    chosen = {}  # estimated rate -> index of the decision it leads to
+
+    curve = []
+    for n in sample_sizes:
+        k = np.arange(n + 1)
+        pmf = stats.binom.pmf(k, n, params[rate_key])
+        kept = pmf > 1e-12
+        pmf = pmf[kept] / pmf[kept].sum()
+        expected_profit = 0.0
+        expected_events = 0.0
+        for defects, probability in zip(k[kept], pmf):
+            estimate = defects / n
+            if estimate not in chosen:
+                rates = list(true_rates)
+                rates[position] = estimate
+                estimated_profits = profits_at(tuple(rates))
+                chosen[estimate] = max(range(len(DECISIONS)), key=estimated_profits.__getitem__)
+            expected_profit += probability * true_profits[chosen[estimate]]
+            expected_events += probability * events[chosen[estimate]]
+        sampling_cost = n * expected_events * params[cost_key]
+        curve.append({
+            'Sample Size': n,
+            'Expected Profit': expected_profit,
+            'Expected Regret': best_true_profit - expected_profit,
+            'Sampling Cost': sampling_cost,
+            'Net Profit': expected_profit - sampling_cost,
+        })
+    return pd.DataFrame(curve)
+
+
+def optimal_sample_sizes(params, sample_sizes=range(10, 501, 10)):
+    """
+    Cost-optimal sample size per stage, i.e. the one maximising expected profit net of sampling cost.
+    """
+    result = {}
+    for stage in SAMPLED_STAGES:
+        curve = sample_size_value_curve(params, stage, sample_sizes)
+        result[stage] = (int(curve.loc[curve['Net Profit'].idxmax(), 'Sample Size']), curve)
+    return result
 
 
 def main():
@@ -150,6 +253,7 @@ def main():
     ]
 
     num_simulations = 1000  # Number of simulations for each case
+    batch_size = 100  # Simulations folded into the profit summary at a time
 
     for i, case in enumerate(table_cases, 1):
         case_params = params.copy()
@@ -165,10 +269,18 @@ def main():
                                 (False, False, True, True): 0, (False, False, True, False): 0,
                                 (False, False, False, True): 0, (False, False, False, False): 0}
         
+        summary = StrategyProfitSummary(len(DECISIONS))
+        batch = []
         for _ in range(num_simulations):
-            best_profit, best_decisions = optimize_decisions(case_params)
-            total_profit += best_profit
-            best_decisions_count[best_decisions] += 1
+            profits = evaluate_decisions(case_params)
+            best_index = max(range(len(profits)), key=profits.__getitem__)
+            total_profit += profits[best_index]
+            best_decisions_count[DECISIONS[best_index]] += 1
+            batch.append(profits)
+            if len(batch) == batch_size:
+                summary.update(batch)
+                batch = []
+        summary.update(batch)
         
         avg_profit = total_profit / num_simulations
         most_common_decision = max(best_decisions_count, key=best_decisions_count.get)
@@ -181,6 +293,13 @@ def main():
               f"Inspect Product: {most_common_decision[2]}, "
               f"Disassemble Defective: {most_common_decision[3]}")
         print(f"Decision distribution: {best_decisions_count}")
+        print("Profit distribution per decision:")
+        print(summary.to_frame(DECISIONS).sort_values("Mean", ascending=False).to_string(index=False))
+
+        for stage, (best_size, curve) in optimal_sample_sizes(case_params).items():
+            best_row = curve.loc[curve['Sample Size'] == best_size].iloc[0]
+            print(f"Optimal sample size for {stage}: {best_size} "
+                  f"(expected regret {best_row['Expected Regret']:.2f}, sampling cost {best_row['Sampling Cost']:.2f})")
 
 
 if __name__ == "__main__":
@@ -1,7 +1,15 @@
+import glob
+import hashlib
 import itertools
+import json
+import os
+import numpy as np
 import pandas as pd
+import production_kernels
 import random
 from collections import Counter
+from production_kernels import build_production_config, split_decisions
+from strategy_profit_summary import StrategyProfitSummary
 
 
 def sample_inspection(population_size, sample_size, true_defect_rate):
@@ -12,24 +20,33 @@ def sample_inspection(population_size, sample_size, true_defect_rate):
 
 
 def multi_stage_production_decision_process(
-    initial_quantity,
-    component_params,
-    semi_product_params,
-    final_product_params,
-    max_cycles=2
+    config,
+    decisions,
+    max_cycles=2,
+    sample_sizes=None
 ):
+    # sample_sizes 为各零件、各半成品、成品抽样检测的样本量（见 production_kernels.inspection_stages），默认均为 100
+    if sample_sizes is None:
+        sample_sizes = production_kernels.default_sample_sizes(config)
+    initial_quantity = config.initial_quantity
+    component_params = config.component_params
+    semi_product_params = config.semi_product_params
+    final_product_params = config.final_product_params
+    (inspect_components, inspect_semi_products, disassemble_semi_products,
+     inspect_final, disassemble_final) = split_decisions(decisions, len(component_params), len(semi_product_params))
+
     total_revenue = 0
     total_cost = 0
     
     for comp in component_params:
-        total_cost += initial_quantity * comp['purchase_cost']
+        total_cost += initial_quantity * comp.purchase_cost
 
     inventories = []
-    for comp in component_params:
-        if comp['inspect']:
-            estimated_defect_rate = sample_inspection(initial_quantity, min(100, initial_quantity), comp['true_defect_rate'])
+    for c, (comp, inspect) in enumerate(zip(component_params, inspect_components)):
+        if inspect:
+            estimated_defect_rate = sample_inspection(initial_quantity, min(sample_sizes[c], initial_quantity), comp.defect_rate)
             inventory = int(initial_quantity * (1 - estimated_defect_rate))
-            total_cost += initial_quantity * comp['inspection_cost']
+            total_cost += initial_quantity * comp.inspection_cost
         else:
             inventory = initial_quantity
         inventories.append(inventory)
@@ -39,29 +56,30 @@ def multi_stage_production_decision_process(
     for cycle in range(max_cycles):
         semi_products = []
         for idx, semi_prod in enumerate(semi_product_params):
-            assembled = min([inventories[i-1] for i in semi_prod['components']])
+            assembled = min([inventories[i-1] for i in semi_prod.components])
             assembled += semi_product_inventories[idx]
             semi_product_inventories[idx] = 0
             
-            for i in semi_prod['components']:
+            for i in semi_prod.components:
                 inventories[i-1] -= min(assembled, inventories[i-1])
-            total_cost += assembled * semi_prod['assembly_cost']
+            total_cost += assembled * semi_prod.assembly_cost
 
             semi_product_quality = 1.0
-            for i in semi_prod['components']:
-                if not component_params[i-1]['inspect']:
-                    semi_product_quality *= (1 - component_params[i-1]['true_defect_rate'])
-            semi_product_quality *= (1 - semi_prod['true_defect_rate'])
+            for i in semi_prod.components:
+                if not inspect_components[i-1]:
+                    semi_product_quality *= (1 - component_params[i-1].defect_rate)
+            semi_product_quality *= (1 - semi_prod.defect_rate)
 
             actual_qualified = int(assembled * semi_product_quality)
-            if semi_prod['inspect'] and assembled > 0:
-                estimated_defect_rate = sample_inspection(assembled, min(100, assembled), 1 - semi_product_quality)
+            if inspect_semi_products[idx] and assembled > 0:
+                estimated_defect_rate = sample_inspection(assembled, min(sample_sizes[len(component_params) + idx], assembled),
+                                                      1 - semi_product_quality)
                 qualified = int(assembled * (1 - estimated_defect_rate))
                 defective = assembled - qualified
-                total_cost += assembled * semi_prod['inspection_cost']
-                if semi_prod['disassemble']:
-                    total_cost += defective * semi_prod['disassembly_cost']
-                    for i in semi_prod['components']:
+                total_cost += assembled * semi_prod.inspection_cost
+                if disassemble_semi_products[idx]:
+                    total_cost += defective * semi_prod.disassembly_cost
+                    for i in semi_prod.components:
                         inventories[i-1] += defective
             else:
                 qualified = assembled
@@ -69,55 +87,46 @@ def multi_stage_production_decision_process(
             semi_products.append((qualified, actual_qualified))
 
         final_assembled = min([sp[0] for sp in semi_products])
-        total_cost += final_assembled * final_product_params['assembly_cost']
+        total_cost += final_assembled * final_product_params.assembly_cost
         
         final_quality = 1.0
         for idx, sp in enumerate(semi_products):
             qualified, actual_qualified = sp
             semi_product_quality = actual_qualified / qualified if qualified > 0 else 0
             final_quality *= semi_product_quality
-        final_quality *= (1 - final_product_params['true_defect_rate'])  
+        final_quality *= (1 - final_product_params.defect_rate)  
 
         actual_qualified_products = int(final_assembled * final_quality)
 
-        if final_product_params['inspect'] and final_assembled > 0:
-            estimated_defect_rate = sample_inspection(final_assembled, min(100, final_assembled), 1 - final_quality)
+        if inspect_final and final_assembled > 0:
+            estimated_defect_rate = sample_inspection(final_assembled, min(sample_sizes[-1], final_assembled), 1 - final_quality)
             qualified_products = int(final_assembled * (1 - estimated_defect_rate))
             defective_products = final_assembled - qualified_products
-            total_cost += final_assembled * final_product_params['inspection_cost']
+            total_cost += final_assembled * final_product_params.inspection_cost
             returned_products = 0
         else:
             qualified_products = actual_qualified_products
             defective_products = final_assembled - qualified_products
             returned_products = defective_products
-            total_cost += returned_products * final_product_params['return_loss']
+            total_cost += returned_products * final_product_params.return_loss
         
-        total_revenue += qualified_products * final_product_params['market_price']
+        total_revenue += qualified_products * final_product_params.market_price
         
         total_defective = defective_products
-        if total_defective > 0 and final_product_params['disassemble']:
-            total_cost += total_defective * final_product_params['disassembly_cost']
+        if total_defective > 0 and disassemble_final:
+            total_cost += total_defective * final_product_params.disassembly_cost
             for i in range(len(semi_product_params)):
                 semi_product_inventories[i] += total_defective // len(semi_product_params)
 
     profit = total_revenue - total_cost
     return profit, total_revenue, total_cost
 
-def optimize_multi_stage_decisions(params, decision_combinations):
+def optimize_multi_stage_decisions(config, decision_combinations):
     best_profit = float('-inf')
     best_decision = None
 
     for decisions in decision_combinations:
-        for i, decision in enumerate(decisions[:8]):
-            params['component_params'][i]['inspect'] = decision
-        for i, decision in enumerate(decisions[8:11]):
-            params['semi_product_params'][i]['inspect'] = decision
-        for i, decision in enumerate(decisions[11:14]):
-            params['semi_product_params'][i]['disassemble'] = decision
-        params['final_product_params']['inspect'] = decisions[14]
-        params['final_product_params']['disassemble'] = decisions[15]
-        
-        profit, revenue, cost = multi_stage_production_decision_process(**params)
+        profit, revenue, cost = multi_stage_production_decision_process(config, decisions)
         
         if profit > best_profit:
             best_profit = profit
@@ -126,37 +135,433 @@ def optimize_multi_stage_decisions(params, decision_combinations):
     return best_decision, best_profit
 
 
-def run_multiple_simulations(params, decision_combinations, num_simulations=1000):
+def run_multiple_simulations(config, decision_combinations, num_simulations=1000):
     best_decisions = []
     for _ in range(num_simulations):
-        best_decision, best_profit = optimize_multi_stage_decisions(params, decision_combinations)
+        best_decision, best_profit = optimize_multi_stage_decisions(config, decision_combinations)
         best_decisions.append(best_decision)
     
     decision_counts = Counter(tuple(decision) for decision in best_decisions)
     return decision_counts
 
 
+def plan_shards(num_simulations, num_candidates, simulations_per_shard=100, candidates_per_shard=None):
+    # 按模拟序号区间 × 候选决策区间划分分片，每个分片记录所属的分片计划
+    candidates_per_shard = candidates_per_shard or num_candidates
+    plan = {'num_simulations': num_simulations, 'simulations_per_shard': simulations_per_shard,
+            'candidates_per_shard': candidates_per_shard}
+    return [
+        {'sim_start': s, 'sim_stop': min(s + simulations_per_shard, num_simulations),
+         'cand_start': c, 'cand_stop': min(c + candidates_per_shard, num_candidates), 'plan': plan}
+        for s in range(0, num_simulations, simulations_per_shard)
+        for c in range(0, num_candidates, candidates_per_shard)
+    ]
+
+
+def shard_key(shard):
+    return shard['sim_start'], shard['sim_stop'], shard['cand_start'], shard['cand_stop']
+
+
+def combinations_digest(decision_combinations):
+    # 用于确认各分片基于同一组候选决策
+    return hashlib.sha256(repr([tuple(d) for d in decision_combinations]).encode()).hexdigest()
+
+
+def config_digest(config):
+    # 配置是由数字和元组组成的 namedtuple，repr 完整地反映了全部参数
+    return hashlib.sha256(repr(config).encode()).hexdigest()
+
+
+def run_settings(config, decision_combinations, seed, backend, max_cycles):
+    """
+    决定模拟结果的全部设置。检查点中保存一份，恢复和合并前逐项核对，
+    避免修改参数后沿用旧的结果。backend 为已经解析过的后端。
+    """
+    return {
+        'seed': seed,
+        'combinations_digest': combinations_digest(decision_combinations),
+        'config_digest': config_digest(config),
+        'use_kernel': backend is not None,
+        'max_cycles': max_cycles,
+    }
+
+
+def check_settings(path, state, settings):
+    mismatched = [key for key in settings if state.get(key) != settings[key]]
+    if mismatched:
+        raise ValueError(f"{path} 与当前设置不一致（{', '.join(mismatched)}），请换一个目录或删除旧文件后重新运行")
+
+
+def read_shard_checkpoints(checkpoint_dir, shards, settings):
+    """
+    读取目录中已有的分片检查点，返回 {分片区间: 状态}。
+    区间不属于当前分片计划（例如修改分片大小之前留下的、与计划中的分片重叠的）或设置不一致时报错。
+    """
+    planned = {shard_key(shard) for shard in shards}
+    states = {}
+    for path in sorted(glob.glob(os.path.join(checkpoint_dir, 'shard_*.json'))):
+        with open(path, 'r') as f:
+            state = json.load(f)
+        if shard_key(state) not in planned:
+            raise ValueError(f"分片 {path} 的区间不在当前的分片计划中（与计划中的分片重叠或超出范围），"
+                             f"可能是修改 simulations_per_shard 或 candidates_per_shard 之前留下的")
+        check_settings(path, state, dict(settings, plan=shards[0]['plan']))
+        states[shard_key(state)] = state
+    return states
+
+
+def shard_path(checkpoint_dir, shard):
+    return os.path.join(checkpoint_dir, "shard_s{sim_start}-{sim_stop}_c{cand_start}-{cand_stop}.json".format(**shard))
+
+
+def save_checkpoint(path, state):
+    # 先写临时文件再原子替换，中断时不会留下半个检查点
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def run_shard(config, decision_combinations, shard, checkpoint_dir, seed=2024, checkpoint_every=50, profit_store=None,
+              backend=None, max_cycles=2):
+    """
+    运行一个分片：对区间内每次模拟，在候选区间内求最优决策，并累计每个候选的利润分布汇总。
+    每次模拟前按 (种子, 模拟序号, 候选起点) 重设随机数，因此从检查点恢复的结果与不中断时一致。
+    已有检查点的种子、决策组合、配置、后端、周期数或分片计划与当前不同时报错。
+    给出 profit_store 时，同时把该分片的全部利润写入利润矩阵对应的行列块。
+    backend 经 production_kernels.resolve_backend 解析后不为 None 时用内核计算
+    （抽样随机数的用法不同，结果与默认实现不可混用）；'auto' 总是使用内核，未安装 Numba 时为纯 Python 内核，
+    因此同一种子的结果与是否安装 Numba 无关。
+    """
+    path = shard_path(checkpoint_dir, shard)
+    backend = production_kernels.resolve_backend(backend, sampled=True)
+    settings = dict(run_settings(config, decision_combinations, seed, backend, max_cycles), plan=shard['plan'])
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            state = json.load(f)
+        check_settings(path, state, settings)
+    else:
+        state = dict(shard, **settings, next_simulation=shard['sim_start'], best_profits=[], best_indices=[],
+                     summary=StrategyProfitSummary(shard['cand_stop'] - shard['cand_start']).to_dict())
+
+    candidates = decision_combinations[shard['cand_start']:shard['cand_stop']]
+    summary = StrategyProfitSummary.from_dict(state['summary'])
+    pending_profits = []  # 上个检查点之后的利润，写检查点前整批并入汇总
+    for sim in range(state['next_simulation'], shard['sim_stop']):
+        random.seed(f"{seed}-{sim}-{shard['cand_start']}")
+        best_profit = float('-inf')
+        best_index = None
+        profits = []
+        for j, decisions in enumerate(candidates):
+            if backend is not None:
+                profit, revenue, cost = production_kernels.evaluate(config, decisions, max_cycles=max_cycles,
+                                                                    sampled=True, backend=backend)
+            else:
+                profit, revenue, cost = multi_stage_production_decision_process(config, decisions, max_cycles)
+            profits.append(profit)
+            if profit > best_profit:
+                best_profit = profit
+                best_index = shard['cand_start'] + j
+        state['best_profits'].append(best_profit)
+        state['best_indices'].append(best_index)
+        state['next_simulation'] = sim + 1
+        pending_profits.append(profits)
+        if profit_store is not None:
+            profit_store[sim, shard['cand_start']:shard['cand_stop']] = profits
+
+        if (sim + 1 - shard['sim_start']) % checkpoint_every == 0 or sim + 1 == shard['sim_stop']:
+            if profit_store is not None:
+                profit_store.flush()  # 检查点之前的利润必须已落盘
+            summary.update(pending_profits)
+            pending_profits = []
+            state['summary'] = summary.to_dict()
+            save_checkpoint(path, state)
+    return state
+
+
+def merge_shards(checkpoint_dirs, config, decision_combinations, num_simulations, simulations_per_shard=100,
+                 candidates_per_shard=None, seed=2024, backend=None, max_cycles=2):
+    """
+    合并一个或多个目录（例如多台机器各自的检查点目录）中的分片结果，参数须与运行时相同。
+    种子、配置、后端等设置不同的分片，以及不属于当前分片计划的分片都会被拒绝。
+    每次模拟的最优决策取各候选分片最优值中的最大者，返回最优决策计数和各策略的利润分布汇总。
+    """
+    backend = production_kernels.resolve_backend(backend, sampled=True)
+    settings = run_settings(config, decision_combinations, seed, backend, max_cycles)
+    planned = plan_shards(num_simulations, len(decision_combinations), simulations_per_shard, candidates_per_shard)
+    shards = {}
+    for checkpoint_dir in checkpoint_dirs:
+        for key, state in read_shard_checkpoints(checkpoint_dir, planned, settings).items():
+            if state['next_simulation'] != state['sim_stop']:
+                raise ValueError(f"分片 {shard_path(checkpoint_dir, state)} 尚未完成")
+            # 同一分片在多处出现时只保留一份
+            shards[key] = state
+
+    best_profits = [float('-inf')] * num_simulations
+    best_indices = [None] * num_simulations
+    covered = [0] * num_simulations
+    summary = StrategyProfitSummary(len(decision_combinations))
+
+    # 按候选起点顺序合并，利润相同时与单机运行一样保留靠前的决策
+    for key in sorted(shards, key=lambda k: (k[2], k[0])):
+        state = shards[key]
+        sim_start, sim_stop, cand_start, cand_stop = key
+        for offset, sim in enumerate(range(sim_start, sim_stop)):
+            covered[sim] += cand_stop - cand_start
+            if state['best_profits'][offset] > best_profits[sim]:
+                best_profits[sim] = state['best_profits'][offset]
+                best_indices[sim] = state['best_indices'][offset]
+        summary.merge(StrategyProfitSummary.from_dict(state['summary']), offset=cand_start)
+
+    missing = [sim for sim in range(num_simulations) if covered[sim] != len(decision_combinations)]
+    if missing:
+        raise ValueError(f"缺少 {len(missing)} 次模拟的分片结果，例如第 {missing[0]} 次")
+
+    # 分片内只知道候选区间内的最优，成为最优的次数以合并后的结果为准
+    summary.best_counts = np.bincount(best_indices, minlength=len(decision_combinations))
+    decision_counts = Counter(tuple(decision_combinations[i]) for i in best_indices)
+    return decision_counts, summary
+
+
+def run_sharded_simulations(config, decision_combinations, num_simulations=1000, checkpoint_dir='checkpoints',
+                            simulations_per_shard=100, candidates_per_shard=None, seed=2024,
+                            machine_index=0, num_machines=1, profit_store_path=None, backend=None, max_cycles=2):
+    """
+    可中断、可恢复的模拟：已完成的分片直接跳过，未完成的分片从最后一个检查点继续。
+    开始前核对目录中已有的检查点，设置或分片计划不同时报错，不会沿用旧参数的结果。
+    多台机器使用相同参数、不同 machine_index 运行后，把检查点目录汇总再调用 merge_shards。
+    给出 profit_store_path 时把完整的 模拟 × 策略 利润矩阵保存为内存映射文件，供事后查询；
+    多台机器各自的利润矩阵只含本机的分片，用 merge_profit_stores 合并后再查询。
+    backend 见 run_shard。
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    shards = plan_shards(num_simulations, len(decision_combinations), simulations_per_shard, candidates_per_shard)
+    settings = run_settings(config, decision_combinations, seed,
+                            production_kernels.resolve_backend(backend, sampled=True), max_cycles)
+    read_shard_checkpoints(checkpoint_dir, shards, settings)
+    profit_store = None
+    if profit_store_path is not None:
+        profit_store = open_profit_store(profit_store_path, num_simulations, decision_combinations,
+                                         dict(settings, plan=shards[0]['plan']))
+    for shard in shards[machine_index::num_machines]:
+        run_shard(config, decision_combinations, shard, checkpoint_dir, seed=seed, profit_store=profit_store,
+                  backend=backend, max_cycles=max_cycles)
+
+
+def open_profit_store(path, num_simulations, decision_combinations, settings):
+    """
+    打开（不存在时创建）float32 利润矩阵 path.npy 及其索引 path.json。
+    矩阵按行存放每次模拟、按列存放每个策略，未写入的位置为 NaN。
+    索引中保存 settings（见 run_settings，包括种子和配置摘要），与当前设置不同的矩阵不会被继续写入，
+    否则已完成分片的行仍是旧参数下的利润。
+    """
+    shape = (num_simulations, len(decision_combinations))
+    if os.path.exists(path + '.npy') and os.path.exists(path + '.json'):
+        with open(path + '.json', 'r') as f:
+            index = json.load(f)
+        if tuple(index['shape']) != shape:
+            raise ValueError(f"利润矩阵 {path} 与当前的决策组合数或模拟次数不一致")
+        check_settings(path + '.json', index, settings)
+        return np.load(path + '.npy', mmap_mode='r+')
+
+    store = np.lib.format.open_memmap(path + '.npy', mode='w+', dtype=np.float32, shape=shape)
+    store[:] = np.nan
+    store.flush()
+    index = dict(
+        settings,
+        shape=list(shape),
+        dtype='float32',
+        # 每个策略以 0/1 字符串表示，顺序与矩阵的列一致
+        strategies=[''.join('1' if d else '0' for d in decisions) for decisions in decision_combinations],
+    )
+    save_checkpoint(path + '.json', index)
+    return store
+
+
+def load_profit_store(path):
+    # 只读打开利润矩阵，数据按需从磁盘分页读取
+    with open(path + '.json', 'r') as f:
+        index = json.load(f)
+    return np.load(path + '.npy', mmap_mode='r'), index
+
+
+def merge_profit_stores(paths, path, chunk_rows=1024):
+    """
+    把多台机器各自写入的利润矩阵（每台只写了自己的分片，其余位置为 NaN）合并为 path.npy 及其索引。
+    各矩阵的索引（设置、形状、策略）必须完全相同；每个位置取第一个已写入的值。
+    """
+    stores = []
+    index = None
+    for store_path in paths:
+        store, store_index = load_profit_store(store_path)
+        if index is None:
+            index = store_index
+        else:
+            check_settings(store_path + '.json', store_index, index)
+        stores.append(store)
+
+    merged = np.lib.format.open_memmap(path + '.npy', mode='w+', dtype=np.float32, shape=tuple(index['shape']))
+    for start in range(0, merged.shape[0], chunk_rows):
+        block = np.array(stores[0][start:start + chunk_rows])
+        for store in stores[1:]:
+            missing = np.isnan(block)
+            block[missing] = store[start:start + chunk_rows][missing]
+        merged[start:start + chunk_rows] = block
+    merged.flush()
+    save_checkpoint(path + '.json', index)
+    return merged
+
+
+def complete_rows(chunk):
+    # 中断的运行或多台机器分工时，利润矩阵中未写入的位置为 NaN，只保留整行都已写入的模拟
+    return chunk[~np.isnan(chunk).any(axis=1)]
+
+
+def strategy_column(index, decisions):
+    return index['strategies'].index(''.join('1' if d else '0' for d in decisions))
+
+
+def strategy_quantiles(store, column, quantiles=(0.05, 0.5, 0.95)):
+    # 单个策略的利润分位数，只读取该列，跳过未写入的模拟
+    profits = np.asarray(store[:, column], dtype=np.float64)
+    profits = profits[~np.isnan(profits)]
+    if profits.size == 0:
+        raise ValueError(f"利润矩阵第 {column} 列还没有写入任何模拟")
+    return np.quantile(profits, quantiles)
+
+
+def regret_summary(store, tolerance=0.01, chunk_rows=1024):
+    """
+    按行分块扫描利润矩阵，返回每个策略的平均遗憾（当次最优利润减该策略利润）
+    以及利润在最优值 tolerance 相对范围内的频率。
+    只统计全部策略都已写入的模拟，第三个返回值为统计的模拟次数。
+    """
+    num_simulations, num_strategies = store.shape
+    regret_sums = np.zeros(num_strategies)
+    near_best_counts = np.zeros(num_strategies, dtype=np.int64)
+    completed = 0
+    for start in range(0, num_simulations, chunk_rows):
+        chunk = complete_rows(np.asarray(store[start:start + chunk_rows], dtype=np.float64))
+        completed += chunk.shape[0]
+        best = chunk.max(axis=1, keepdims=True)
+        regret_sums += (best - chunk).sum(axis=0)
+        near_best_counts += (chunk >= best - tolerance * np.abs(best)).sum(axis=0)
+    if completed == 0:
+        raise ValueError("利润矩阵中没有写完整的模拟，多台机器的结果请先用 merge_profit_stores 合并")
+    return regret_sums / completed, near_best_counts / completed, completed
+
+
+def pairwise_win_rates(store, columns, chunk_rows=1024):
+    """
+    指定策略两两之间利润严格更高的频率，结果[i, j] 为策略 i 胜过策略 j 的比例。
+    只统计这些策略都已写入的模拟，第二个返回值为统计的模拟次数。
+    """
+    columns = list(columns)
+    num_simulations = store.shape[0]
+    wins = np.zeros((len(columns), len(columns)), dtype=np.int64)
+    completed = 0
+    for start in range(0, num_simulations, chunk_rows):
+        chunk = complete_rows(np.asarray(store[start:start + chunk_rows, columns]))
+        completed += chunk.shape[0]
+        wins += (chunk[:, :, None] > chunk[:, None, :]).sum(axis=0)
+    if completed == 0:
+        raise ValueError("利润矩阵中没有写完整的模拟，多台机器的结果请先用 merge_profit_stores 合并")
+    return wins / completed, completed
+
+
+def stage_inspection_cost(config, stage):
+    # 第 stage 个检测环节（见 production_kernels.inspection_stages）的单件检测成本
+    n, m = len(config.component_params), len(config.semi_product_params)
+    if stage < n:
+        return config.component_params[stage].inspection_cost
+    if stage < n + m:
+        return config.semi_product_params[stage - n].inspection_cost
+    return config.final_product_params.inspection_cost
+
+
+def sample_size_value_curve(config, candidates, stage, sample_sizes, num_simulations=200, max_cycles=2, seed=2024,
+                            backend='auto'):
+    """
+    第 stage 个检测环节样本量的信息价值，其余环节保持默认样本量 100。
+    每次模拟按抽样估计下的利润在 candidates 中选出最优决策，再按真实次品率（不抽样的确定性模型）
+    计算所选决策的利润；遗憾为候选中真实最优的利润减去该利润。半成品和成品每个周期都要抽样，
+    抽样成本按所选决策在该环节各次抽样实际抽取的总件数（由内核统计）乘以单件检测成本，再对模拟取平均。
+    各样本量共用同一批随机数（每次模拟只生成一次，样本量为 n 时取前 n 列），整条曲线在一遍模拟中算出，
+    相邻样本量之间的差异不受抽样噪声干扰。随机数要逐行交给内核，因此总是使用 production_kernels 的内核。
+    """
+    backend = production_kernels.resolve_backend(backend, sampled=True) or 'python'
+    true_profits = [production_kernels.evaluate(config, decisions, max_cycles, backend=backend)[0]
+                    for decisions in candidates]
+    best_true_profit = max(true_profits)
+
+    sizes = list(production_kernels.default_sample_sizes(config))
+    rows = production_kernels.num_uniform_rows(config, max_cycles)
+    width = max(max(sample_sizes), production_kernels.SAMPLE_SIZE)
+    rng = np.random.default_rng(seed)
+    realized_profits = np.zeros(len(sample_sizes))
+    sampled_units = np.zeros(len(sample_sizes))
+    for _ in range(num_simulations):
+        uniforms = rng.random((rows, width))
+        for i, n in enumerate(sample_sizes):
+            sizes[stage] = n
+            estimated_profits = []
+            candidate_units = []
+            for decisions in candidates:
+                units = np.zeros(len(sizes), dtype=np.int64)
+                estimated_profits.append(
+                    production_kernels.evaluate(config, decisions, max_cycles, sampled=True, uniforms=uniforms,
+                                                backend=backend, sample_sizes=sizes, sampled_units=units)[0])
+                candidate_units.append(units[stage])
+            chosen = int(np.argmax(estimated_profits))
+            realized_profits[i] += true_profits[chosen]
+            sampled_units[i] += candidate_units[chosen]
+
+    expected_profits = realized_profits / num_simulations
+    sampling_costs = sampled_units / num_simulations * stage_inspection_cost(config, stage)
+    return pd.DataFrame({
+        'Sample Size': list(sample_sizes),
+        'Expected Profit': expected_profits,
+        'Expected Regret': best_true_profit - expected_profits,
+        'Sampling Cost': sampling_costs,
+        'Net Profit': expected_profits - sampling_costs,
+    })
+
+
+def optimal_sample_sizes(config, candidates, sample_sizes=(10, 25, 50, 100, 200, 400), **kwargs):
+    """
+    各检测环节净利润（期望利润减抽样成本）最高的样本量，返回 {环节: (样本量, 曲线)}。
+    kwargs 传给 sample_size_value_curve。
+    """
+    result = {}
+    for stage, name in enumerate(production_kernels.inspection_stages(config)):
+        curve = sample_size_value_curve(config, candidates, stage, sample_sizes, **kwargs)
+        result[name] = (int(curve.loc[curve['Net Profit'].idxmax(), 'Sample Size']), curve)
+    return result
+
+
 def main():
     params = {
         'initial_quantity': 1000,
         'component_params': [
-            {'true_defect_rate': 0.10, 'purchase_cost': 2, 'inspection_cost': 1, 'inspect': False},
-            {'true_defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1, 'inspect': False},
-            {'true_defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2, 'inspect': False},
-            {'true_defect_rate': 0.10, 'purchase_cost': 2, 'inspection_cost': 1, 'inspect': False},
-            {'true_defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1, 'inspect': False},
-            {'true_defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2, 'inspect': False},
-            {'true_defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1, 'inspect': False},
-            {'true_defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2, 'inspect': False}
+            {'true_defect_rate': 0.10, 'purchase_cost': 2, 'inspection_cost': 1},
+            {'true_defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1},
+            {'true_defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2},
+            {'true_defect_rate': 0.10, 'purchase_cost': 2, 'inspection_cost': 1},
+            {'true_defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1},
+            {'true_defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2},
+            {'true_defect_rate': 0.10, 'purchase_cost': 8, 'inspection_cost': 1},
+            {'true_defect_rate': 0.10, 'purchase_cost': 12, 'inspection_cost': 2}
         ],
         'semi_product_params': [
-            {'true_defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [1, 2, 3], 'inspect': False, 'disassemble': False},
-            {'true_defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [4, 5, 6], 'inspect': False, 'disassemble': False},
-            {'true_defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [7, 8], 'inspect': False, 'disassemble': False}
+            {'true_defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [1, 2, 3]},
+            {'true_defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [4, 5, 6]},
+            {'true_defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 4, 'disassembly_cost': 6, 'components': [7, 8]}
         ],
         'final_product_params': {
             'true_defect_rate': 0.10, 'assembly_cost': 8, 'inspection_cost': 6, 'market_price': 200,
-            'disassembly_cost': 10, 'return_loss': 40, 'inspect': False, 'disassemble': False
+            'disassembly_cost': 10, 'return_loss': 40
         }
     }
 
@@ -164,7 +569,15 @@ def main():
     with open('decision_combinations.txt', 'r') as f:
         decision_combinations = [eval(line.strip()) for line in f]
 
-    decision_counts = run_multiple_simulations(params, decision_combinations)
+    config = build_production_config(params, rate_key='true_defect_rate')
+    num_simulations = 1000
+    checkpoint_dir = 'checkpoints'  # 中断后重新运行会从这里的检查点继续
+    profit_store_path = None  # 设为 'profit_store' 可保存完整利润矩阵，用 load_profit_store 等函数事后分析
+    backend = 'auto'  # 有 Numba 时使用编译内核，否则使用结果相同的纯 Python 内核；设为 None 使用上面的原始实现
+    run_sharded_simulations(config, decision_combinations, num_simulations, checkpoint_dir,
+                            profit_store_path=profit_store_path, backend=backend)
+    decision_counts, summary = merge_shards([checkpoint_dir], config, decision_combinations, num_simulations,
+                                            backend=backend)
     
     print("最优策略统计结果:")
     for decision, count in decision_counts.most_common():
@@ -177,6 +590,19 @@ def main():
     df.to_excel("optimal_strategies_distribution.xlsx", index=False)
     print("结果已保存到 optimal_strategies_distribution.xlsx 文件中。")
 
+    # 各策略的利润分布与成为最优的概率，按平均利润排序
+    summary_df = summary.to_frame(decision_combinations).sort_values("Mean", ascending=False)
+    summary_df.to_excel("strategy_profit_summary.xlsx", index=False)
+    print("各策略利润分布汇总已保存到 strategy_profit_summary.xlsx 文件中。")
+
+    # 在平均利润最高的若干个策略之间比较各检测环节的样本量，候选越多越慢
+    top_candidates = [decision_combinations[i] for i in np.argsort(-summary.mean, kind='stable')[:16]]
+    for stage, (best_size, curve) in optimal_sample_sizes(config, top_candidates, num_simulations=100,
+                                                          backend=backend).items():
+        best_row = curve.loc[curve['Sample Size'] == best_size].iloc[0]
+        print(f"{stage} 的最优样本量: {best_size}（期望遗憾 {best_row['Expected Regret']:.2f}，"
+              f"抽样成本 {best_row['Sampling Cost']:.2f}）")
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -20,32 +20,144 @@ def sample_inspection(population_size, sample_size, true_defect_rate):
 def run_multiple_inspections(population_size, sample_size, true_defect_rate, num_simulations):
     return [sample_inspection(population_size, sample_size, true_defect_rate)[0] for _ in range(num_simulations)]
 
+
+class StreamingEstimateStats:
+    """
+    估计次品率的在线统计量，内存占用与模拟次数无关。
+    均值/方差按 Welford（分块合并）更新；直方图使用固定分箱，
+    每个绘图分箱再细分为 sketch_resolution 个子箱，用作中位数等分位数的草图，
+    分位数误差不超过一个子箱宽度。
+    """
+
+    def __init__(self, value_range, bins=50, sketch_resolution=64):
+        self.lower, self.upper = value_range
+        self.bins = bins
+        self.sketch_resolution = sketch_resolution
+        self.fine_bins = bins * sketch_resolution
+        self.fine_width = (self.upper - self.lower) / self.fine_bins
+        self.fine_counts = np.zeros(self.fine_bins, dtype=np.int64)
+        self.below = 0  # 落在分箱范围外的样本数
+        self.above = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        n = values.size
+        if n == 0:
+            return
+        # 分块 Welford：先求块内统计量，再与累计量合并
+        chunk_mean = values.mean()
+        chunk_m2 = np.square(values - chunk_mean).sum()
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + delta * delta * self.count * n / total
+        self.count = total
+
+        idx = np.floor((values - self.lower) / self.fine_width).astype(np.int64)
+        idx[values == self.upper] = self.fine_bins - 1
+        self.below += int(np.count_nonzero(idx < 0))
+        self.above += int(np.count_nonzero(idx >= self.fine_bins))
+        inside = idx[(idx >= 0) & (idx < self.fine_bins)]
+        self.fine_counts += np.bincount(inside, minlength=self.fine_bins)
+
+    @property
+    def std(self):
+        # 与 np.std 一致，使用总体标准差
+        return (self.m2 / self.count) ** 0.5 if self.count else 0.0
+
+    def quantile(self, q):
+        # 在累计频数上定位，子箱内线性插值
+        target = q * self.count - self.below
+        if target <= 0:
+            return self.lower
+        cumulative = np.cumsum(self.fine_counts)
+        i = int(np.searchsorted(cumulative, target))
+        if i >= self.fine_bins:
+            return self.upper
+        before = cumulative[i - 1] if i > 0 else 0
+        fraction = (target - before) / self.fine_counts[i]
+        return self.lower + (i + fraction) * self.fine_width
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+    def rmse(self, true_value):
+        # E[(X - p)^2] = 方差 + 偏差^2
+        bias = self.mean - true_value
+        return (self.m2 / self.count + bias * bias) ** 0.5
+
+    def histogram(self):
+        counts = self.fine_counts.reshape(self.bins, self.sketch_resolution).sum(axis=1)
+        edges = np.linspace(self.lower, self.upper, self.bins + 1)
+        return counts, edges
+
+
+def estimate_value_range(sample_size, true_defect_rate, num_std=6):
+    # 以二项分布的标准误确定直方图范围，超出部分只计入 below/above
+    std_error = (true_defect_rate * (1 - true_defect_rate) / sample_size) ** 0.5
+    margin = num_std * std_error + 1 / (sample_size + 1)
+    return max(0.0, true_defect_rate - margin), min(1.0, true_defect_rate + margin)
+
+
+def run_streaming_inspections(sample_size, true_defect_rate, num_simulations, chunk_size=1_000_000, seed=None, bins=50):
+    """
+    分块向量化地生成估计次品率，并直接折叠进在线统计量，不保存单次结果。
+    估计方式与 sample_inspection 相同：(次品数 + U(0,1)) / (样本量 + 1)。
+    """
+    if seed is None:
+        seed = random.getrandbits(64)  # 未指定时从 random 模块取种子，使 random.seed 同样控制流式模式
+    rng = np.random.default_rng(seed)
+    stats = StreamingEstimateStats(estimate_value_range(sample_size, true_defect_rate), bins=bins)
+    remaining = num_simulations
+    while remaining > 0:
+        n = min(chunk_size, remaining)
+        defects = rng.binomial(sample_size, true_defect_rate, size=n)
+        stats.update((defects + rng.random(n)) / (sample_size + 1))
+        remaining -= n
+    return stats
+
+
 def analyze_results(results, true_defect_rate):
-    mean = np.mean(results)
-    std_dev = np.std(results)
-    median = np.median(results)
-    
+    results = np.asarray(results)
+    rmse = np.sqrt(np.mean((results - true_defect_rate)**2))
+    print_statistics(np.mean(results), np.median(results), np.std(results), len(results), rmse, true_defect_rate)
+
+def analyze_stream(stats, true_defect_rate):
+    print_statistics(stats.mean, stats.median, stats.std, stats.count, stats.rmse(true_defect_rate), true_defect_rate)
+
+def print_statistics(mean, median, std_dev, count, rmse, true_defect_rate):
     print(f"真实次品率: {true_defect_rate:.4f}")
     print(f"平均估计次品率: {mean:.4f}")
     print(f"中位数估计次品率: {median:.4f}")
     print(f"标准差: {std_dev:.4f}")
     
-    sem = std_dev / np.sqrt(len(results))
+    sem = std_dev / np.sqrt(count)
     ci_lower = mean - 1.96 * sem
     ci_upper = mean + 1.96 * sem
     print(f"95%置信区间: ({ci_lower:.4f}, {ci_upper:.4f})")
     
     # 添加偏差和均方根误差
     bias = mean - true_defect_rate
-    rmse = np.sqrt(np.mean((np.array(results) - true_defect_rate)**2))
     print(f"偏差: {bias:.4f}")
     print(f"均方根误差: {rmse:.4f}")
 
 def plot_results(results, true_defect_rate):
+    plot_distribution(dict(x=results, bins=50), np.mean(results), np.std(results), true_defect_rate)
+
+def plot_stream(stats, true_defect_rate):
+    # 直接用累计的分箱频数作为权重绘制直方图
+    counts, edges = stats.histogram()
+    plot_distribution(dict(x=edges[:-1], bins=edges, weights=counts), stats.mean, stats.std, true_defect_rate)
+
+def plot_distribution(hist_kwargs, mean, std_dev, true_defect_rate):
     plt.figure(figsize=(12, 7))
-    n, bins, patches = plt.hist(results, bins=50, edgecolor='black', alpha=0.7)
+    n, bins, patches = plt.hist(**hist_kwargs, edgecolor='black', alpha=0.7)
     plt.axvline(true_defect_rate, color='r', linestyle='dashed', linewidth=2, label='真实次品率')
-    plt.axvline(np.mean(results), color='g', linestyle='dashed', linewidth=2, label='平均估计次品率')
+    plt.axvline(mean, color='g', linestyle='dashed', linewidth=2, label='平均估计次品率')
     
     plt.xlabel('估计次品率')
     plt.ylabel('频数')
@@ -54,8 +166,8 @@ def plot_results(results, true_defect_rate):
     
     # 添加注释
     plt.annotate(f'真实次品率: {true_defect_rate:.4f}', xy=(0.7, 0.95), xycoords='axes fraction')
-    plt.annotate(f'平均估计次品率: {np.mean(results):.4f}', xy=(0.7, 0.90), xycoords='axes fraction')
-    plt.annotate(f'标准差: {np.std(results):.4f}', xy=(0.7, 0.85), xycoords='axes fraction')
+    plt.annotate(f'平均估计次品率: {mean:.4f}', xy=(0.7, 0.90), xycoords='axes fraction')
+    plt.annotate(f'标准差: {std_dev:.4f}', xy=(0.7, 0.85), xycoords='axes fraction')
     
     plt.savefig('defect_rate_distribution.png', dpi=300, bbox_inches='tight')
     plt.close()
@@ -65,11 +177,16 @@ def main():
     sample_size = 100
     true_defect_rate = 0.10
     num_simulations = 50000  # 增加模拟次数
+    streaming = True  # 流式模式：分块生成并在线统计，内存与模拟次数无关
 
-    results = run_multiple_inspections(population_size, sample_size, true_defect_rate, num_simulations)
-    
-    analyze_results(results, true_defect_rate)
-    plot_results(results, true_defect_rate)
+    if streaming:
+        stats = run_streaming_inspections(sample_size, true_defect_rate, num_simulations)
+        analyze_stream(stats, true_defect_rate)
+        plot_stream(stats, true_defect_rate)
+    else:
+        results = run_multiple_inspections(population_size, sample_size, true_defect_rate, num_simulations)
+        analyze_results(results, true_defect_rate)
+        plot_results(results, true_defect_rate)
 
     print("分布图已保存为 'defect_rate_distribution.png'")
 
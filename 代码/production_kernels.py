@@ -0,0 +1,433 @@
+"""
+问题三/问题四多阶段生产过程的参数配置与计算内核。
+
+两个脚本共用这里的不可变参数记录（namedtuple 自带 __slots__），决策单独传入，
+同一份配置可以在多个线程或进程间只读共享。
+内核只使用标量循环和数组下标，同一份源码既可以直接由 Python 执行，
+也可以在安装了 Numba 时编译为机器码（编译结果缓存在磁盘上，之后启动无需重新编译）。
+两个后端对相同输入给出完全相同的结果，并且与问题三、问题四脚本中原有的实现一致，可运行本文件进行校验。
+"""
+import functools
+import importlib.util
+import numbers
+import os
+import random
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    import numba
+    import numba.extending
+except ImportError:
+    numba = None
+
+SAMPLE_SIZE = 100  # 抽样检测的默认样本量，与问题四脚本中的 min(100, 数量) 一致
+
+ComponentParams = namedtuple('ComponentParams', ['defect_rate', 'purchase_cost', 'inspection_cost'])
+SemiProductParams = namedtuple('SemiProductParams', ['defect_rate', 'assembly_cost', 'inspection_cost', 'disassembly_cost', 'components'])
+FinalProductParams = namedtuple('FinalProductParams', ['defect_rate', 'assembly_cost', 'inspection_cost', 'market_price', 'disassembly_cost', 'return_loss'])
+ProductionConfig = namedtuple('ProductionConfig', ['initial_quantity', 'component_params', 'semi_product_params', 'final_product_params'])
+
+
+def build_production_config(params, rate_key='defect_rate'):
+    """
+    由参数字典构造不可变配置，字典中的 inspect/disassemble 等决策字段被忽略。
+    rate_key 为字典中次品率的键名（问题四的参数写作 true_defect_rate）。
+    """
+    def field(record, name):
+        return record[rate_key] if name == 'defect_rate' else record[name]
+
+    return ProductionConfig(
+        initial_quantity=params['initial_quantity'],
+        component_params=tuple(
+            ComponentParams(*(field(comp, f) for f in ComponentParams._fields)) for comp in params['component_params']
+        ),
+        semi_product_params=tuple(
+            SemiProductParams(semi[rate_key], semi['assembly_cost'], semi['inspection_cost'],
+                              semi['disassembly_cost'], tuple(semi['components']))
+            for semi in params['semi_product_params']
+        ),
+        final_product_params=FinalProductParams(
+            *(field(params['final_product_params'], f) for f in FinalProductParams._fields)
+        ),
+    )
+
+
+def inspection_stages(config):
+    # 抽样检测的环节：各零件、各半成品、成品，顺序与 sample_sizes 一致
+    return ([f'零件{i}' for i in range(1, len(config.component_params) + 1)]
+            + [f'半成品{i}' for i in range(1, len(config.semi_product_params) + 1)]
+            + ['成品'])
+
+
+def default_sample_sizes(config):
+    return (SAMPLE_SIZE,) * len(inspection_stages(config))
+
+
+def split_decisions(decisions, num_components, num_semi_products):
+    # 决策顺序：各零件检测、各半成品检测、各半成品拆解、成品检测、成品拆解
+    n, m = num_components, num_semi_products
+    return (decisions[:n], decisions[n:n + m], decisions[n + m:n + 2 * m],
+            decisions[n + 2 * m], decisions[n + 2 * m + 1])
+
+
+def production_kernel(
+    initial_quantity, max_cycles, sampled, uniforms, sample_sizes, sampled_units,
+    comp_defect_rate, comp_purchase_cost, comp_inspection_cost, comp_inspect,
+    semi_defect_rate, semi_assembly_cost, semi_inspection_cost, semi_disassembly_cost,
+    semi_components, semi_num_components, semi_inspect, semi_disassemble,
+    final_defect_rate, final_assembly_cost, final_inspection_cost, market_price,
+    final_disassembly_cost, return_loss, final_inspect, final_disassemble
+):
+    """
+    与 multi_stage_production_decision_process 相同的多阶段装配、检测、拆解循环。
+    sampled 为假时按问题三使用真实次品率；为真时按问题四用抽样估计的次品率，
+    每次抽样使用 uniforms 中固定的一行随机数：先是各零件，然后每个周期依次为各半成品和成品。
+    sample_sizes 为各零件、各半成品、成品的样本量，uniforms 的列数不能小于其中的最大值。
+    sampled_units 与 sample_sizes 同长，每次抽样时把实际抽取的件数累加到对应环节上。
+    semi_components 为以 0 起始的零件下标，每行前 semi_num_components 个有效。
+    """
+    num_components = len(comp_defect_rate)
+    num_semi = len(semi_defect_rate)
+    total_revenue = 0.0
+    total_cost = 0.0
+
+    for c in range(num_components):
+        total_cost += initial_quantity * comp_purchase_cost[c]
+
+    inventories = [0] * num_components
+    for c in range(num_components):
+        if comp_inspect[c]:
+            if sampled:
+                estimated = _sample_defect_rate(uniforms, c, sample_sizes[c], initial_quantity,
+                                                    comp_defect_rate[c])
+                sampled_units[c] += min(sample_sizes[c], initial_quantity)
+            else:
+                estimated = comp_defect_rate[c]
+            inventories[c] = int(initial_quantity * (1 - estimated))
+            total_cost += initial_quantity * comp_inspection_cost[c]
+        else:
+            inventories[c] = initial_quantity
+
+    semi_inventories = [0] * num_semi
+    semi_qualified = [0] * num_semi
+    semi_actual_qualified = [0] * num_semi
+
+    for cycle in range(max_cycles):
+        row = num_components + cycle * (num_semi + 1)
+        for s in range(num_semi):
+            assembled = inventories[semi_components[s][0]]
+            for t in range(1, semi_num_components[s]):
+                assembled = min(assembled, inventories[semi_components[s][t]])
+            assembled += semi_inventories[s]
+            semi_inventories[s] = 0
+
+            for t in range(semi_num_components[s]):
+                c = semi_components[s][t]
+                inventories[c] -= min(assembled, inventories[c])
+            total_cost += assembled * semi_assembly_cost[s]
+
+            quality = 1.0
+            for t in range(semi_num_components[s]):
+                c = semi_components[s][t]
+                if not comp_inspect[c]:
+                    quality *= (1 - comp_defect_rate[c])
+            quality *= (1 - semi_defect_rate[s])
+
+            actual_qualified = int(assembled * quality)
+            if semi_inspect[s] and (assembled > 0 or not sampled):
+                if sampled:
+                    estimated = _sample_defect_rate(uniforms, row + s, sample_sizes[num_components + s],
+                                                    assembled, 1 - quality)
+                    sampled_units[num_components + s] += min(sample_sizes[num_components + s], assembled)
+                    qualified = int(assembled * (1 - estimated))
+                else:
+                    qualified = actual_qualified
+                defective = assembled - qualified
+                total_cost += assembled * semi_inspection_cost[s]
+                if semi_disassemble[s]:
+                    total_cost += defective * semi_disassembly_cost[s]
+                    for t in range(semi_num_components[s]):
+                        inventories[semi_components[s][t]] += defective
+            else:
+                qualified = assembled
+            semi_qualified[s] = qualified
+            semi_actual_qualified[s] = actual_qualified
+
+        final_assembled = semi_qualified[0]
+        for s in range(1, num_semi):
+            final_assembled = min(final_assembled, semi_qualified[s])
+        total_cost += final_assembled * final_assembly_cost
+
+        final_quality = 1.0
+        for s in range(num_semi):
+            final_quality *= semi_actual_qualified[s] / semi_qualified[s] if semi_qualified[s] > 0 else 0
+        final_quality *= (1 - final_defect_rate)
+
+        actual_qualified_products = int(final_assembled * final_quality)
+        if final_inspect and (final_assembled > 0 or not sampled):
+            if sampled:
+                estimated = _sample_defect_rate(uniforms, row + num_semi, sample_sizes[num_components + num_semi],
+                                                final_assembled, 1 - final_quality)
+                sampled_units[num_components + num_semi] += min(sample_sizes[num_components + num_semi],
+                                                                final_assembled)
+                qualified_products = int(final_assembled * (1 - estimated))
+            else:
+                qualified_products = actual_qualified_products
+            defective_products = final_assembled - qualified_products
+            total_cost += final_assembled * final_inspection_cost
+        else:
+            qualified_products = actual_qualified_products
+            defective_products = final_assembled - qualified_products
+            total_cost += defective_products * return_loss
+
+        total_revenue += qualified_products * market_price
+
+        if defective_products > 0 and final_disassemble:
+            total_cost += defective_products * final_disassembly_cost
+            for s in range(num_semi):
+                semi_inventories[s] += defective_products // num_semi
+
+    return total_revenue - total_cost, total_revenue, total_cost
+
+
+def _sample_defect_rate(uniforms, row, max_sample_size, population_size, true_defect_rate):
+    # 与 sample_inspection 相同：样本量取 min(max_sample_size, 总数)，用第 row 行随机数判定次品
+    sample_size = min(max_sample_size, population_size)
+    if sample_size == 0:
+        return 0.0
+    defects = 0
+    for t in range(sample_size):
+        if uniforms[row][t] < true_defect_rate:
+            defects += 1
+    return defects / sample_size
+
+
+if numba is not None:
+    # 让内核在 Python 和编译代码中都能调用抽样函数
+    _sample_defect_rate = numba.extending.register_jitable(_sample_defect_rate)
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled_kernel():
+    # cache=True 把编译结果写入 __pycache__（或 NUMBA_CACHE_DIR），之后的进程直接加载
+    return numba.njit(cache=True)(production_kernel)
+
+
+def available_backends():
+    return ['python', 'numba'] if numba is not None else ['python']
+
+
+def resolve_backend(backend, sampled=False):
+    """
+    脚本中的 backend 参数：'auto' 在安装了 Numba 时取 'numba'；否则不抽样时取 None，即使用脚本中原有的实现
+    （纯 Python 内核比原有实现慢），抽样时取 'python'，因为原有实现取随机数的方式与内核不同，
+    只有两个内核后端对相同的种子给出相同的结果。其余取值原样返回。
+    """
+    if backend == 'auto':
+        if numba is not None:
+            return 'numba'
+        return 'python' if sampled else None
+    return backend
+
+
+def get_kernel(backend='auto'):
+    """
+    backend 为 'python'、'numba' 或 'auto'（有 Numba 时使用 Numba，否则退回纯 Python）。
+    """
+    if backend == 'auto':
+        backend = 'numba' if numba is not None else 'python'
+    if backend == 'python':
+        return production_kernel
+    if backend == 'numba':
+        if numba is None:
+            raise ImportError("未安装 numba，无法使用 numba 后端")
+        return _compiled_kernel()
+    raise ValueError(f"未知的后端: {backend}")
+
+
+@functools.lru_cache(maxsize=32)
+def pack_config(config):
+    # 把不可变的 ProductionConfig 转成内核使用的数组，结果按配置缓存
+    components = config.component_params
+    semis = config.semi_product_params
+    max_components = max(len(semi.components) for semi in semis)
+    semi_components = np.zeros((len(semis), max_components), dtype=np.int64)
+    for s, semi in enumerate(semis):
+        semi_components[s, :len(semi.components)] = [i - 1 for i in semi.components]
+    final = config.final_product_params
+    return (
+        np.array([comp.defect_rate for comp in components], dtype=np.float64),
+        np.array([comp.purchase_cost for comp in components], dtype=np.float64),
+        np.array([comp.inspection_cost for comp in components], dtype=np.float64),
+        np.array([semi.defect_rate for semi in semis], dtype=np.float64),
+        np.array([semi.assembly_cost for semi in semis], dtype=np.float64),
+        np.array([semi.inspection_cost for semi in semis], dtype=np.float64),
+        np.array([semi.disassembly_cost for semi in semis], dtype=np.float64),
+        semi_components,
+        np.array([len(semi.components) for semi in semis], dtype=np.int64),
+        float(final.assembly_cost), float(final.inspection_cost), float(final.market_price),
+        float(final.disassembly_cost), float(final.return_loss), float(final.defect_rate),
+        _has_integer_costs(config),
+    )
+
+
+def _has_integer_costs(config):
+    # 数量、成本和售价都是整数时，原有实现得到的利润、收入、成本也都是整数
+    final = config.final_product_params
+    values = [config.initial_quantity, final.assembly_cost, final.inspection_cost, final.market_price,
+              final.disassembly_cost, final.return_loss]
+    for comp in config.component_params:
+        values += [comp.purchase_cost, comp.inspection_cost]
+    for semi in config.semi_product_params:
+        values += [semi.assembly_cost, semi.inspection_cost, semi.disassembly_cost]
+    return all(isinstance(value, numbers.Integral) for value in values)
+
+
+def num_uniform_rows(config, max_cycles):
+    return len(config.component_params) + max_cycles * (len(config.semi_product_params) + 1)
+
+
+def evaluate(config, decisions, max_cycles, sampled=False, uniforms=None, backend='auto', sample_sizes=None,
+             sampled_units=None):
+    """
+    用所选后端计算一个决策的 (利润, 收入, 成本)。
+    sampled 为真且未给出 uniforms 时，从 random 模块取种子生成随机数，使 random.seed 同样控制内核。
+    sample_sizes 为各检测环节的样本量（见 inspection_stages），默认均为 SAMPLE_SIZE。
+    给出 sampled_units（长度与 sample_sizes 相同的 int64 数组）时，各环节所有抽样事件实际抽取的件数累加到其中。
+    """
+    (comp_defect_rate, comp_purchase_cost, comp_inspection_cost,
+     semi_defect_rate, semi_assembly_cost, semi_inspection_cost, semi_disassembly_cost,
+     semi_components, semi_num_components,
+     final_assembly_cost, final_inspection_cost, market_price,
+     final_disassembly_cost, return_loss, final_defect_rate, integer_costs) = pack_config(config)
+    n, m = len(comp_defect_rate), len(semi_defect_rate)
+    decisions = np.asarray(decisions, dtype=np.bool_)
+    if sample_sizes is None:
+        sample_sizes = default_sample_sizes(config)
+    sample_sizes = np.asarray(sample_sizes, dtype=np.int64)
+    width = max(int(sample_sizes.max()), 1)
+    if uniforms is None:
+        if sampled:
+            rng = np.random.default_rng(random.getrandbits(64))
+            uniforms = rng.random((num_uniform_rows(config, max_cycles), width))
+        else:
+            uniforms = np.zeros((1, width))
+    elif sampled and uniforms.shape[1] < width:
+        # 编译后的内核不检查下标越界，这里先行检查
+        raise ValueError(f"uniforms 只有 {uniforms.shape[1]} 列，小于最大样本量 {width}")
+    if sampled_units is None:
+        sampled_units = np.zeros(len(sample_sizes), dtype=np.int64)
+
+    kernel = get_kernel(backend)
+    profit, revenue, cost = kernel(
+        config.initial_quantity, max_cycles, sampled, uniforms, sample_sizes, sampled_units,
+        comp_defect_rate, comp_purchase_cost, comp_inspection_cost, decisions[:n],
+        semi_defect_rate, semi_assembly_cost, semi_inspection_cost, semi_disassembly_cost,
+        semi_components, semi_num_components, decisions[n:n + m], decisions[n + m:n + 2 * m],
+        final_defect_rate, final_assembly_cost, final_inspection_cost, market_price,
+        final_disassembly_cost, return_loss, decisions[n + 2 * m], decisions[n + 2 * m + 1]
+    )
+    if integer_costs:
+        # 整数在 float64 中的累加是精确的，转回 int 与原有实现的结果类型一致
+        return int(profit), int(revenue), int(cost)
+    return float(profit), float(revenue), float(cost)
+
+
+def verify_backends(config, decision_combinations, max_cycles, sampled, seed=2024):
+    """
+    共用的一致性校验：对每个决策，用相同的随机数分别运行所有可用后端，结果必须完全相同。
+    """
+    backends = available_backends()
+    rng = np.random.default_rng(seed)
+    for decisions in decision_combinations:
+        uniforms = rng.random((num_uniform_rows(config, max_cycles), SAMPLE_SIZE))
+        results = [evaluate(config, decisions, max_cycles, sampled, uniforms, backend) for backend in backends]
+        if any(result != results[0] for result in results[1:]):
+            raise AssertionError(f"后端结果不一致: 决策 {decisions}: {dict(zip(backends, results))}")
+    return backends
+
+
+# 内核需要与之保持一致的原有实现：不抽样时为问题三，抽样时为问题四
+REFERENCE_SCRIPTS = {
+    False: 'problem_3_semi_finished_goods_analysis.py.py',
+    True: 'problem_4_defective_rate_change_with_problem_3_execution.py.py',
+}
+
+
+def load_script(file_name):
+    # 脚本文件名带有多余的 .py，无法直接 import，按路径加载（不会运行 main）
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+    spec = importlib.util.spec_from_file_location(file_name.split('.')[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def verify_reference(config, decision_combinations, max_cycles, sampled, seed=2024, sample_sizes=None):
+    """
+    把各后端与脚本中的 multi_stage_production_decision_process 逐个决策比较，结果必须完全相同。
+    sample_sizes 只在抽样时使用，同时传给两边。
+    抽样时 uniforms 的各行取同一行随机数，并让问题四脚本的 sample_inspection 每次都读这一行，
+    两边的抽样结果因此完全相同；同时记录脚本实际抽取的总件数，与内核的 sampled_units 之和比较。
+    """
+    script = load_script(REFERENCE_SCRIPTS[sampled])
+    backends = available_backends()
+    rng = np.random.default_rng(seed)
+    for decisions in decision_combinations:
+        row = rng.random(SAMPLE_SIZE)
+        uniforms = np.tile(row, (num_uniform_rows(config, max_cycles), 1))
+        drawn = []
+        if sampled:
+            script.sample_inspection = functools.partial(_sample_from_row, row.tolist(), drawn)
+            expected = script.multi_stage_production_decision_process(config, decisions, max_cycles, sample_sizes)
+        else:
+            expected = script.multi_stage_production_decision_process(config, decisions, max_cycles)
+        for backend in backends:
+            sampled_units = np.zeros(len(inspection_stages(config)), dtype=np.int64)
+            result = evaluate(config, decisions, max_cycles, sampled, uniforms, backend, sample_sizes, sampled_units)
+            if sampled_units.sum() != sum(drawn):
+                raise AssertionError(f"{backend} 后端的抽样件数与 {REFERENCE_SCRIPTS[sampled]} 不一致: "
+                                     f"决策 {decisions}: {sampled_units.sum()} != {sum(drawn)}")
+            # 原有实现在成本为整数时返回 int，内核此时也必须返回 int
+            as_int = all(isinstance(value, int) for value in expected)
+            if result != expected or as_int and not all(isinstance(value, int) for value in result):
+                raise AssertionError(f"{backend} 后端与 {REFERENCE_SCRIPTS[sampled]} 不一致: "
+                                     f"决策 {decisions}: {result} != {expected}")
+    return backends
+
+
+def _sample_from_row(row, drawn, population_size, sample_size, true_defect_rate):
+    # 与问题四脚本的 sample_inspection 接口相同，随机数固定取 row 的前 sample_size 个，抽取件数记入 drawn
+    drawn.append(sample_size)
+    if sample_size == 0:
+        return 0
+    return sum(u < true_defect_rate for u in row[:sample_size]) / sample_size
+
+
+def main():
+    import itertools
+
+    rng = random.Random(2024)
+    decision_combinations = list(itertools.product([True, False], repeat=16))
+    for case in range(20):
+        config = ProductionConfig(
+            rng.choice([0, 1, 57, 1000]),
+            tuple(ComponentParams(rng.uniform(0, 0.3), rng.randint(1, 12), rng.randint(1, 3)) for _ in range(8)),
+            (SemiProductParams(rng.uniform(0, 0.3), 8, 4, 6, (1, 2, 3)),
+             SemiProductParams(rng.uniform(0, 0.3), 8, 4, 6, (4, 5, 6)),
+             SemiProductParams(rng.uniform(0, 0.3), 8, 4, 6, (7, 8))),
+            FinalProductParams(rng.uniform(0, 0.3), 8, 6, 200, 10, 40),
+        )
+        sample = rng.sample(decision_combinations, 200)
+        for sampled, max_cycles in ((False, 3), (True, 2)):
+            backends = verify_backends(config, sample, max_cycles, sampled, seed=case)
+            verify_reference(config, sample[:50], max_cycles, sampled, seed=case)
+        sample_sizes = tuple(rng.choice([0, 1, 30, SAMPLE_SIZE]) for _ in inspection_stages(config))
+        verify_reference(config, sample[:50], 2, True, seed=case, sample_sizes=sample_sizes)
+    print(f"后端结果一致，且与问题三、问题四脚本的实现一致: {', '.join(backends)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+问题四两个脚本共用的各策略利润分布汇总。
+"""
+import numpy as np
+import pandas as pd
+
+
+class StrategyProfitSummary:
+    """
+    每个策略利润分布的在线汇总，按批（模拟次数 × 策略数 的利润矩阵）更新。
+    均值/方差按分块 Welford 合并；分位数使用对数分桶草图，相对误差不超过 relative_accuracy，
+    桶数只随利润的数量级范围增长；同时统计每个策略成为当次最优的次数。
+    汇总可以合并，也可以转成字典写入检查点。
+    """
+
+    BUCKET_OFFSET = 1 << 20  # 保证正负利润的桶编号互不重叠
+    MIN_MAGNITUDE = 1e-9  # 绝对值更小的利润计入 0 桶
+
+    def __init__(self, num_strategies, relative_accuracy=0.005):
+        self.relative_accuracy = relative_accuracy
+        self.log_gamma = np.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self.count = np.zeros(num_strategies, dtype=np.int64)
+        self.mean = np.zeros(num_strategies)
+        self.m2 = np.zeros(num_strategies)
+        self.min = np.full(num_strategies, np.inf)
+        self.max = np.full(num_strategies, -np.inf)
+        self.best_counts = np.zeros(num_strategies, dtype=np.int64)
+        self.buckets = [{} for _ in range(num_strategies)]
+
+    def update(self, profits):
+        profits = np.asarray(profits, dtype=np.float64)
+        if profits.size == 0:
+            return
+        n = profits.shape[0]
+        chunk_mean = profits.mean(axis=0)
+        chunk_m2 = np.square(profits - chunk_mean).sum(axis=0)
+        self._combine(n, chunk_mean, chunk_m2, slice(None))
+        self.min = np.minimum(self.min, profits.min(axis=0))
+        self.max = np.maximum(self.max, profits.max(axis=0))
+        # argmax 取第一个最大值，与逐个比较 profit > best_profit 的结果一致
+        self.best_counts += np.bincount(profits.argmax(axis=1), minlength=profits.shape[1])
+
+        # 一次 np.unique 统计整批的 (策略, 桶) 频数
+        keys = self._bucket_keys(profits)
+        width = 4 * self.BUCKET_OFFSET
+        columns = np.broadcast_to(np.arange(profits.shape[1]), profits.shape)
+        combined, counts = np.unique(columns * width + keys + width // 2, return_counts=True)
+        for code, c in zip(combined.tolist(), counts.tolist()):
+            column, key = divmod(code, width)
+            buckets = self.buckets[column]
+            key -= width // 2
+            buckets[key] = buckets.get(key, 0) + c
+
+    def _combine(self, n, chunk_mean, chunk_m2, columns):
+        count = self.count[columns]
+        total = count + n
+        delta = chunk_mean - self.mean[columns]
+        weight = n / np.maximum(total, 1)
+        self.mean[columns] += delta * weight
+        self.m2[columns] += chunk_m2 + delta * delta * count * weight
+        self.count[columns] = total
+
+    def _bucket_keys(self, profits):
+        magnitude = np.abs(profits)
+        safe = np.maximum(magnitude, self.MIN_MAGNITUDE)
+        index = np.ceil(np.log(safe) / self.log_gamma).astype(np.int64) + self.BUCKET_OFFSET
+        return np.where(magnitude < self.MIN_MAGNITUDE, 0, np.sign(profits).astype(np.int64) * index)
+
+    def _bucket_value(self, key):
+        if key == 0:
+            return 0.0
+        gamma = np.exp(self.log_gamma)
+        magnitude = 2 * gamma ** (abs(key) - self.BUCKET_OFFSET) / (gamma + 1)
+        return magnitude if key > 0 else -magnitude
+
+    def merge(self, other, offset=0):
+        # 把 other 的各策略合并到本汇总第 offset 列起的位置（用于拼接不同候选区间的分片）
+        columns = slice(offset, offset + len(other.count))
+        self._combine(other.count, other.mean, other.m2, columns)
+        self.min[columns] = np.minimum(self.min[columns], other.min)
+        self.max[columns] = np.maximum(self.max[columns], other.max)
+        self.best_counts[columns] += other.best_counts
+        for buckets, other_buckets in zip(self.buckets[columns], other.buckets):
+            for key, c in other_buckets.items():
+                buckets[key] = buckets.get(key, 0) + c
+
+    @property
+    def std(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.m2 / self.count)
+
+    def quantile(self, q):
+        result = np.full(len(self.count), np.nan)
+        for column, buckets in enumerate(self.buckets):
+            if not buckets:
+                continue
+            values = sorted((self._bucket_value(key), c) for key, c in buckets.items())
+            rank = q * (self.count[column] - 1)
+            seen = 0
+            for value, c in values:
+                seen += c
+                if seen > rank:
+                    break
+            result[column] = min(max(value, self.min[column]), self.max[column])
+        return result
+
+    def best_probability(self, z=1.96):
+        # 成为最优的概率及其 Wilson 置信区间；p 为 0 或 1 时端点的舍入误差会越出 [0, 1]，需要截断
+        n = np.maximum(self.count, 1)
+        p = self.best_counts / n
+        denominator = 1 + z * z / n
+        center = (p + z * z / (2 * n)) / denominator
+        half_width = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+        return p, np.clip(center - half_width, 0, 1), np.clip(center + half_width, 0, 1)
+
+    def to_frame(self, strategies):
+        p, ci_lower, ci_upper = self.best_probability()
+        return pd.DataFrame({
+            "Strategy": [str(strategy) for strategy in strategies],
+            "Mean": self.mean, "Std": self.std, "Min": self.min,
+            "P05": self.quantile(0.05), "Median": self.quantile(0.5), "P95": self.quantile(0.95),
+            "Max": self.max,
+            "BestProbability": p, "BestCILower": ci_lower, "BestCIUpper": ci_upper,
+        })
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'count': self.count.tolist(), 'mean': self.mean.tolist(), 'm2': self.m2.tolist(),
+            'min': self.min.tolist(), 'max': self.max.tolist(), 'best_counts': self.best_counts.tolist(),
+            'buckets': [{str(key): c for key, c in buckets.items()} for buckets in self.buckets],
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        summary = cls(len(state['count']), state['relative_accuracy'])
+        summary.count = np.array(state['count'], dtype=np.int64)
+        summary.mean = np.array(state['mean'])
+        summary.m2 = np.array(state['m2'])
+        summary.min = np.array(state['min'])
+        summary.max = np.array(state['max'])
+        summary.best_counts = np.array(state['best_counts'], dtype=np.int64)
+        summary.buckets = [{int(key): c for key, c in buckets.items()} for buckets in state['buckets']]
+        return summary